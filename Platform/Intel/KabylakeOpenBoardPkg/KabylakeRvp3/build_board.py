@@ -39,6 +39,35 @@ def build_ex(config, functions):
     return None
 
 
+def post_rebase_ex(config, functions):
+    """Optional function called once the rebased FSP binaries are created
+
+    :param config: The environment variables to be used in the build process
+    :type config: Dictionary
+    :param functions: A dictionary of function pointers
+    :type functions: Dictionary
+    :returns: config dictionary
+    :rtype: Dictionary
+    """
+    print("post_rebase_ex")
+    return None
+
+
+def pre_fit_ex(config, functions):
+    """Optional function called before the FIT table is generated
+
+    :param config: The environment variables to be used in the post
+        build process
+    :type config: Dictionary
+    :param functions: A dictionary of function pointers
+    :type functions: Dictionary
+    :returns: config dictionary
+    :rtype: Dictionary
+    """
+    print("pre_fit_ex")
+    return None
+
+
 def post_build_ex(config, functions):
     """Additional Post BIOS build function
 
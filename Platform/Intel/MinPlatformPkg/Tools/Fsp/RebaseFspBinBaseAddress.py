@@ -6,93 +6,168 @@
 
 import os
 import sys
-import re
-import subprocess
-
-if len(sys.argv) not in [5,6]:
-  print ("RebaseFspBinBaseAddress.py - Error in number of arguments received")
-  print ("Usage - RebaseFspBinBaseAddress.py <FlashMap file path> <FspBinPkg Folder> <Fsp.fd file name>\
-  <pad_offset for Fsp-S Base Address> <OPTIONAL SplitFspBin.py tool path>")
-  exit(1)
-
-flashMapName      = sys.argv[1]
-fspBinPath        = sys.argv[2]
-fspBinFile        = sys.argv[3]
-fvOffset          = int(sys.argv[4], 16)
-fspBinFileRebased = "Fsp_Rebased.fd"
-splitFspBinPath   = os.path.join("edk2","IntelFsp2Pkg","Tools","SplitFspBin.py")
-
-if len(sys.argv) == 6:
-  splitFspBinPath   = sys.argv[5]
 
 #
-# Make sure argument passed or valid
+# Load SplitFspBin.py as a module, so the FSP binary is parsed once
+# in this process instead of once per SplitFspBin.py command
 #
-if not os.path.exists(flashMapName):
-  print ("WARNING!  " + str(flashMapName) + " is not found.")
-  exit(1)
-fspBinFilePath = fspBinPath + os.sep + fspBinFile
-if not os.path.exists(fspBinFilePath):
-  print ("WARNING!  " + str(fspBinFilePath) + " is not found.")
-  exit(1)
-if not os.path.exists(splitFspBinPath):
-  print ("WARNING!  " + str(splitFspBinPath) + " is not found.")
-  exit(1)
+def LoadSplitFspBin (splitFspBinPath):
+  splitFspBinDir = os.path.dirname(os.path.abspath(splitFspBinPath))
+  if splitFspBinDir not in sys.path:
+    sys.path.insert(0, splitFspBinDir)
+  moduleName = os.path.splitext(os.path.basename(splitFspBinPath))[0]
+  return __import__(moduleName)
 
 #
-# Get the FSP-S / FSP-M-T FV Base Address from Flash Map
+# Get the FSP-S / FSP-M / FSP-T FV Base Address from Flash Map
 #
-file = open (flashMapName, "r")
-data = file.read ()
+def GetFspBaseAddress (flashMapName, fvOffset):
+  file = open (flashMapName, "r")
+  data = file.read ()
+  file.close()
 
-# Get the Flash Base Address
-flashBase = int(data.split("FLASH_BASE")[1].split("=")[1].split()[0], 16)
+  # Get the Flash Base Address
+  flashBase = int(data.split("FLASH_BASE")[1].split("=")[1].split()[0], 16)
 
-# Based on Build Target, select the section in the FlashMap file
-flashmap = data
+  # Based on Build Target, select the section in the FlashMap file
+  flashmap = data
 
-# Get FSP-S & FSP-M & FSP-T offset & calculate the base
-for line in flashmap.split("\n"):
-  if "PcdFlashFvFspSOffset" in line:
-    fspSBaseOffset = int(line.split("=")[1].split()[0], 16)
-  if "PcdFlashFvFspMOffset" in line:
-    fspMBaseOffset = int(line.split("=")[1].split()[0], 16)
-  if "PcdFlashFvFspTOffset" in line:
-    fspTBaseOffset = int(line.split("=")[1].split()[0], 16)
-file.close()
+  # Get FSP-S & FSP-M & FSP-T offset & calculate the base
+  for line in flashmap.split("\n"):
+    if "PcdFlashFvFspSOffset" in line:
+      fspSBaseOffset = int(line.split("=")[1].split()[0], 16)
+    if "PcdFlashFvFspMOffset" in line:
+      fspMBaseOffset = int(line.split("=")[1].split()[0], 16)
+    if "PcdFlashFvFspTOffset" in line:
+      fspTBaseOffset = int(line.split("=")[1].split()[0], 16)
 
-#
-# Get FSP-M Size, in order to calculate the FSP-T Base. Used SplitFspBin.py script
-# to dump the header, and get the ImageSize in FSP-M section
-#
-pythontool = 'python'
-if 'PYTHON_HOME' in os.environ:
-    pythontool = os.environ['PYTHON_HOME'] + os.sep + 'python'
-else:
-    pythontool = sys.executable
-Process = subprocess.Popen([pythontool, splitFspBinPath, "info","-f",fspBinFilePath], stdout=subprocess.PIPE)
-Output = Process.communicate()[0]
-FsptInfo = Output.rsplit(b"FSP_M", 1);
-for line in FsptInfo[1].split(b"\n"):
-  if b"ImageSize" in line:
-    fspMSize = int(line.split(b"=")[1], 16)
-    break
-
-# Calculate FSP-S/M/T base address, to which re-base has to be done
-fspSBaseAddress = flashBase + fspSBaseOffset + fvOffset
-fspMBaseAddress = flashBase + fspMBaseOffset
-fspTBaseAddress = flashBase + fspTBaseOffset
+  # Calculate FSP-S/M/T base address, to which re-base has to be done
+  return {
+    "s" : flashBase + fspSBaseOffset + fvOffset,
+    "m" : flashBase + fspMBaseOffset,
+    "t" : flashBase + fspTBaseOffset
+    }
 
 #
-# Re-base FSP bin file to new address and save it as fspBinFileRebased using SplitFspBin.py
+# Re-base the FSP-S/M/T components of the FSP binary held in fd.FdData
+# into newFspBin, this is what "SplitFspBin.py rebase" does
 #
-rebaseArguments = fspBinFilePath + " -c s m t -b " + str(hex(fspSBaseAddress).rstrip("L")) + " " + str(hex(fspMBaseAddress).rstrip("L")) + " " + str(hex(fspTBaseAddress).rstrip("L")) + " -o" + fspBinPath + " -n " + fspBinFileRebased
-os.system(pythontool + " " + splitFspBinPath + " rebase -f" + rebaseArguments)
+def RebaseFspComponents (splitFspBin, fd, fspBaseAddress, newFspBin):
+  for fspComp in ["s", "m", "t"]:
+    found = False
+    for fsp in fd.FspList:
+      if fsp.Type.lower() == fspComp:
+        found = True
+        break
+    if not found:
+      raise Exception("ERROR: Could not find FSP_%c component to rebase !" % fspComp.upper())
+
+    newBase = fspBaseAddress[fspComp]
+    oldBase = fsp.Fih.ImageBase
+    delta   = newBase - oldBase
+    print ("Rebase FSP-%c from 0x%08X to 0x%08X:" % (fspComp.upper(), oldBase, newBase))
+
+    imgList = []
+    for fvIdx in fsp.FvIdxList:
+      fv = fd.FvList[fvIdx]
+      for ffs in fv.FfsList:
+        for sec in ffs.SecList:
+          if sec.SecHdr.Type in [splitFspBin.EFI_SECTION_TYPE.TE, splitFspBin.EFI_SECTION_TYPE.PE32]:
+            offset = fd.Offset + fv.Offset + ffs.Offset + sec.Offset + splitFspBin.sizeof(sec.SecHdr)
+            imgList.append ((offset, len(sec.SecData) - splitFspBin.sizeof(sec.SecHdr)))
+
+    fCount = 0
+    pCount = 0
+    for (offset, length) in imgList:
+      img = splitFspBin.PeTeImage(offset, fd.FdData[offset:offset + length])
+      img.ParseReloc()
+      pCount += img.Rebase(delta, newFspBin)
+      fCount += 1
+    print ("  Patched %d entries in %d TE/PE32 images." % (pCount, fCount))
+
+    (count, applied) = fsp.Patch(delta, newFspBin)
+    print ("  Patched %d entries using FSP patch table." % applied)
+    if count != applied:
+      print ("  %d invalid entries are ignored !" % (count - applied))
 
 #
-# Split FSP bin to FSP-S/M/T segments
+# Re-base the FSP binary and split it into Fsp_Rebased_S/M/T.fd from a
+# single in memory copy of the binary.
 #
-splitArguments = fspBinPath + os.sep + fspBinFileRebased + " -o " + fspBinPath + " -n Fsp_Rebased.fd"
-os.system(pythontool + " " + splitFspBinPath + " split -f" + splitArguments)
+# Fsp_Rebased.fd is the whole re-based binary, or the components listed
+# in concatOrder (e.g. "SMT") concatenated in that order.
+#
+def RebaseAndSplitFspBin (splitFspBinPath, fspBinFilePath, fspBaseAddress, outputDir, fspBinFileRebased = "Fsp_Rebased.fd", concatOrder = None):
+  splitFspBin = LoadSplitFspBin (splitFspBinPath)
+
+  fd = splitFspBin.FirmwareDevice(0, fspBinFilePath)
+  fd.ParseFd  ()
+  fd.ParseFsp ()
+
+  newFspBin = fd.FdData[:]
+  RebaseFspComponents (splitFspBin, fd, fspBaseAddress, newFspBin)
+
+  fspName, ext = os.path.splitext(fspBinFileRebased)
+  newFspView   = memoryview(newFspBin)
+  components   = {}
+  for fsp in fd.FspList:
+    if fsp.Fih.HeaderRevision < 3:
+      raise Exception("ERROR: FSP 1.x is not supported by the split command !")
+    components[fsp.Type] = [newFspView[fd.FvList[fvIdx].Offset:fd.FvList[fvIdx].Offset + fd.FvList[fvIdx].FvHdr.FvLength] for fvIdx in fsp.FvIdxList]
+    fileName = os.path.join(outputDir, fspName + '_' + fsp.Type + ext)
+    print ("Create FSP component file '%s'" % fileName)
+    with open(fileName, "wb") as fspFile:
+      for fvData in components[fsp.Type]:
+        fspFile.write(fvData)
+
+  with open(os.path.join(outputDir, fspBinFileRebased), "wb") as fspFile:
+    if concatOrder is None:
+      fspFile.write(newFspView)
+    else:
+      for fspType in concatOrder:
+        for fvData in components[fspType]:
+          fspFile.write(fvData)
+
+  return 0
+
+def main ():
+  if len(sys.argv) not in [5,6]:
+    print ("RebaseFspBinBaseAddress.py - Error in number of arguments received")
+    print ("Usage - RebaseFspBinBaseAddress.py <FlashMap file path> <FspBinPkg Folder> <Fsp.fd file name>\
+    <pad_offset for Fsp-S Base Address> <OPTIONAL SplitFspBin.py tool path>")
+    return 1
+
+  flashMapName      = sys.argv[1]
+  fspBinPath        = sys.argv[2]
+  fspBinFile        = sys.argv[3]
+  fvOffset          = int(sys.argv[4], 16)
+  fspBinFileRebased = "Fsp_Rebased.fd"
+  splitFspBinPath   = os.path.join("edk2","IntelFsp2Pkg","Tools","SplitFspBin.py")
+
+  if len(sys.argv) == 6:
+    splitFspBinPath   = sys.argv[5]
+
+  #
+  # Make sure argument passed or valid
+  #
+  if not os.path.exists(flashMapName):
+    print ("WARNING!  " + str(flashMapName) + " is not found.")
+    return 1
+  fspBinFilePath = fspBinPath + os.sep + fspBinFile
+  if not os.path.exists(fspBinFilePath):
+    print ("WARNING!  " + str(fspBinFilePath) + " is not found.")
+    return 1
+  if not os.path.exists(splitFspBinPath):
+    print ("WARNING!  " + str(splitFspBinPath) + " is not found.")
+    return 1
+
+  fspBaseAddress = GetFspBaseAddress (flashMapName, fvOffset)
+
+  #
+  # Re-base FSP bin file to new address, save it as fspBinFileRebased
+  # and split it to FSP-S/M/T segments
+  #
+  return RebaseAndSplitFspBin (splitFspBinPath, fspBinFilePath, fspBaseAddress, fspBinPath, fspBinFileRebased)
 
-exit(0)
+if __name__ == '__main__':
+  sys.exit(main())
@@ -8,21 +8,167 @@
 import os
 import re
 import sys
+import glob
+import json
+import stat
 import time
 import shutil
+import hashlib
+import ConfigParser
+import multiprocessing
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+#
+# Directory listings of the walked trees, cached in the build directory and
+# reused for the directories whose mtime did not change
+#
+INVENTORY_CACHE_FILE    = "CheckCodeBase.Inventory.json"
+INVENTORY_CACHE_VERSION = 1
+
+#
+# Used modules, libraries, include files and packages of each build
+# directory, keyed by the absolute build directory and kept in the Build
+# directory of the workspace. A build is only harvested again when its build
+# files change.
+#
+USED_INDEX_FILE    = "CheckCodeBase.Index.json"
+USED_INDEX_VERSION = 2
+
+#
+# MODULE_DIR = c:\home\edkiigit\edk2\MdeModulePkg\Library\BaseSerialPortLib16550
+# BUILD_DIR = c:\home\edkiigit\Build\KabylakeOpenBoardPkg\KabylakeRvp3\DEBUG_VS2015x86
+# COMMON_DEPS = $(WORKSPACE)\MdePkg\Include\Protocol\DebugSupport.h \
+#               $(WORKSPACE)\MdePkg\Include\Ppi\PciCfg2.h \
+# $(OUTPUT_DIR)\X64\Semaphore.obj : $(WORKSPACE)\UefiCpuPkg\Include\Library\MtrrLib.h
+#
+# The comment lines are matched first so the header files they name are
+# skipped. GNU makefiles use / instead of \.
+#
+MakefileRe = re.compile(r"^#[^\n]*|^(MODULE_DIR|BUILD_DIR) = ([^\r\n]*)|\$\(WORKSPACE\)[\\/]([\w\\/.\-]*\.h)\b", re.M)
+
+#
+# Number of build files parsed by a worker process at once, smaller builds
+# are parsed in this process
+#
+BUILD_FILE_CHUNK = 64
+
+#
+# All paths are kept in a canonical form, with / as the separator on every
+# OS, so the Windows (NMAKE) and the Linux (GCC) builds are checked alike
+#
+def NormPath (path):
+    return os.path.normpath(path.replace("\\", "/")).replace("\\", "/")
+
+def JoinPath (dir, path):
+    if os.path.isabs(path):
+        return path
+    return dir.rstrip("/") + "/" + path
+
+def AbsPath (path):
+    return NormPath(os.path.abspath(path))
+
+#
+# The default index is shared by all the builds of the workspace, in its
+# Build directory, or in the build directory when it is not below a Build
+# directory
+#
+def GetDefaultIndexFile (buildDir):
+    buildDir = AbsPath(buildDir)
+    if buildDir.find("/Build/") != -1:
+        return JoinPath(buildDir.split("/Build/")[0] + "/Build", USED_INDEX_FILE)
+    return JoinPath(buildDir, USED_INDEX_FILE)
+
+#
+# Makefile of the NMAKE builds, GNUmakefile of the GCC builds
+#
+def IsMakefile (file):
+    return os.path.basename(file) in ["Makefile", "GNUmakefile"]
+
+#
+# Dependency files written by GCC (-MMD) and the deps.txt of the modules,
+# listing the header files with their full path
+#
+def IsDepsFile (file):
+    return file.endswith(".d") or file.endswith(".deps") or (os.path.basename(file) == "deps.txt")
+
+#
+# Parse a Makefile or a dependency file in one pass, returns the module
+# directory, the build directory and the header files it depends on, or
+# None if the file cannot be read. This runs in the worker processes.
+#
+def ParseBuildFile (fileName):
+    try:
+        file = open(fileName)
+        try:
+            data = file.read()
+        finally:
+            file.close()
+    except EnvironmentError:
+        return None
+
+    moduleDir = None
+    buildDir  = None
+    headList  = []
+    if IsDepsFile(fileName):
+        for item in data.split():
+            item = item.rstrip(":")
+            if item.endswith(".h"):
+                headList.append(NormPath(item))
+        return (moduleDir, buildDir, headList)
+
+    for match in MakefileRe.finditer(data):
+        if match.group(1) == "MODULE_DIR":
+            moduleDir = NormPath(match.group(2))
+        elif match.group(1) == "BUILD_DIR":
+            buildDir = NormPath(match.group(2))
+        elif match.group(3) is not None:
+            headList.append(NormPath(match.group(3)))
+    return (moduleDir, buildDir, headList)
+
+#
+# Convert the unicode strings of a JSON value back to byte string paths
+#
+def JsonToStr (value):
+    if isinstance(value, unicode):
+        return value.encode("latin-1")
+    if isinstance(value, list):
+        return [JsonToStr(item) for item in value]
+    if isinstance(value, dict):
+        return dict([(JsonToStr(key), JsonToStr(item)) for (key, item) in value.items()])
+    return value
+
+#
+# Set of directories, which also tells in O(path depth) whether a path is
+# below one of its directories
+#
+class DirSet(set):
+    def HasParentOf(self, file):
+        index = file.find("/")
+        while index != -1:
+            if file[:index] in self:
+                return True
+            index = file.find("/", index + 1)
+        return False
 
 class FileChecker:
     def __init__(self):
         # sourceRoot == WORKSPACE
         # sourceRoot != PACKAGES_PATH
         self.sourceRoot = ""
-        self.includeCoreList = ["\\CryptoPkg\\", "\\FatBinPkg\\", "\\FatPkg\\", "\\IntelFrameworkModulePkg\\", "\\IntelFrameworkPkg\\", "\\IntelFsp2Pkg\\", "\\IntelFsp2WrapperPkg\\", "\\IntelFspPkg\\", "\\IntelFspWrapperPkg\\", "\\IntelSiliconPkg\\", "\\MdeModulePkg\\", "\\MdePkg\\", "\\NetworkPkg\\", "\\PcAtChipsetPkg\\", "\\PerformancePkg\\", "\\SecurityPkg\\", "\\ShellBinPkg\\", "\\ShellPkg\\", "\\SignedCapsulePkg\\", "\\SourceLevelDebugPkg\\", "\\UefiCpuPkg\\"]
+        self.buildDirList = []
+        self.includeCoreList = ["/CryptoPkg/", "/FatBinPkg/", "/FatPkg/", "/IntelFrameworkModulePkg/", "/IntelFrameworkPkg/", "/IntelFsp2Pkg/", "/IntelFsp2WrapperPkg/", "/IntelFspPkg/", "/IntelFspWrapperPkg/", "/IntelSiliconPkg/", "/MdeModulePkg/", "/MdePkg/", "/NetworkPkg/", "/PcAtChipsetPkg/", "/PerformancePkg/", "/SecurityPkg/", "/ShellBinPkg/", "/ShellPkg/", "/SignedCapsulePkg/", "/SourceLevelDebugPkg/", "/UefiCpuPkg/"]
         self.includeList = self.includeCoreList
-        self.excluseCoreList = ["\\BaseTools\\", "\\Conf\\", "\\Tools\\", "\\Build\\", "\\tool\\", "\\.svn", "\\.git", "\\Override\\", "\\SampleCode\\", "\\openssl"]
+        self.excluseCoreList = ["/BaseTools/", "/Conf/", "/Tools/", "/Build/", "/tool/", "/.svn", "/.git", "/Override/", "/SampleCode/", "/openssl"]
         self.excluseList = self.excluseCoreList
         self.usedModuleList = []
         self.usedLibraryList = []
-        self.makefileList = []
         self.usedIncludeFileList = []
         self.usedModuleFileList = []
         self.usedLibraryFileList = []
@@ -44,27 +190,71 @@ class FileChecker:
         self.unusedFileList = []
         self.unusedPackageList = []
         self.unusedPackageFileList = []
+        self.usedModuleSet = DirSet()
+        self.usedLibrarySet = DirSet()
+        self.usedIncludeFileSet = set()
+        self.usedPackageSet = set()
+        self.unusedModuleSet = DirSet()
+        self.unusedLibrarySet = DirSet()
+        self.unusedPackageSet = DirSet()
+        self.patternReDict = {}
+        self.buildFileDict = {}
+        self.depsFileDict = {}
+        self.indexFile = ""
+        self.buildRecordDict = None
+        self.usedByDict = {}
+        self.inventoryFile = ""
+        self.inventoryDict = {}
+        self.cachedDirDict = {}
+        self.dirDict = {}
+        self.entryIsDir = {}
+        self.finalDirSet = set()
+
+    #
+    # Load the include and exclude lists from a configuration file, the
+    # patterns are parts of the paths, with either / or \ as separator:
+    #
+    # [CheckCodeBase]
+    # IncludeList = /MdePkg/
+    #               /MdeModulePkg/
+    # ExcludeList = /BaseTools/
+    #               /.git
+    #
+    def LoadConfig(self, fileName):
+        config = ConfigParser.RawConfigParser()
+        try:
+            if len(config.read(fileName)) == 0:
+                print "fail to open " + fileName
+                return False
+            if config.has_option("CheckCodeBase", "IncludeList"):
+                self.includeList = [pattern.replace("\\", "/") for pattern in config.get("CheckCodeBase", "IncludeList").split()]
+            if config.has_option("CheckCodeBase", "ExcludeList"):
+                self.excluseList = [pattern.replace("\\", "/") for pattern in config.get("CheckCodeBase", "ExcludeList").split()]
+        except ConfigParser.Error as error:
+            print "fail to parse " + fileName + " - " + str(error)
+            return False
+        return True
 
     def CheckFile(self, file):
-        if os.path.isfile(file):
+        if self.IsFileEntry(file):
             return file.decode('gbk')
         else:
             return ""
 
     def CheckDir(self, file):
-        if os.path.isdir(file):
+        if self.IsDirEntry(file):
             return file.decode('gbk')
         else:
             return ""
 
     def IsIncludeFile(self, file):
-        if (cmp (file[-2:], ".h") == 0) and (file.find ("Pkg\\Include") != -1):
+        if (cmp (file[-2:], ".h") == 0) and (file.find ("Pkg/Include") != -1):
             return True
         else:
             return False
             
     def IsLibraryFile(self, file):
-        if (file.find ("Pkg\\Library") != -1):
+        if (file.find ("Pkg/Library") != -1):
             return True
         else:
             return False
@@ -75,20 +265,60 @@ class FileChecker:
         else:
             return ""
 
+    def GetBuildFileList(self, buildDir):
+        fileList = []
+        for file in self.GetInventory(buildDir):
+            if self.IsFileEntry(file) and (IsMakefile(file) or IsDepsFile(file)):
+                fileList.append(file)
+        return fileList
+
+    #
+    # Parse the Makefiles and dependency files of all the build directories
+    # of buildDirList at once, in a process pool. The dependency files are
+    # attached to the Makefile of the module build directory they are in.
+    #
+    def ParseBuildFiles(self, buildDirList):
+        fileList = []
+        for buildDir in buildDirList:
+            fileList.extend(self.GetBuildFileList(buildDir))
+
+        if len(fileList) > BUILD_FILE_CHUNK:
+            pool = multiprocessing.Pool(min(len(fileList) // BUILD_FILE_CHUNK + 1, multiprocessing.cpu_count()))
+            try:
+                resultList = pool.map(ParseBuildFile, fileList, BUILD_FILE_CHUNK)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            resultList = map(ParseBuildFile, fileList)
+
+        parsedList = []
+        for (file, result) in zip(fileList, resultList):
+            if result is None:
+                print "fail to open " + file
+                continue
+            self.buildFileDict[file] = result
+            parsedList.append(file)
+
+        makefileDirDict = {}
+        for file in parsedList:
+            if not IsDepsFile(file):
+                makefileDirDict[os.path.dirname(file)] = file
+        for file in parsedList:
+            if IsDepsFile(file):
+                dir = os.path.dirname(file)
+                while (dir not in makefileDirDict) and (os.path.dirname(dir) != dir):
+                    dir = os.path.dirname(dir)
+                if dir in makefileDirDict:
+                    self.depsFileDict.setdefault(makefileDirDict[dir], []).append(file)
+
     def GetModulePathFromMakefile (self, file):
-        makefile = open (file, "r")
-        data = makefile.read ()
-        for line in data.split("\n"):
-            # MODULE_DIR = c:\home\edkiigit\edk2\MdeModulePkg\Library\BaseSerialPortLib16550
-            if "MODULE_DIR =" in line:
-                moduleDir = line.split(" = ")[1]
-            # BUILD_DIR = c:\home\edkiigit\Build\KabylakeOpenBoardPkg\KabylakeRvp3\DEBUG_VS2015x86
-            if "BUILD_DIR =" in line:
-                buildDir = line.split(" = ")[1]
-        makefile.close()
+        if file not in self.buildFileDict:
+            self.buildFileDict[file] = ParseBuildFile(file)
+        (moduleDir, buildDir, headList) = self.buildFileDict[file]
 
         # record sourceRoot = c:\home\Edk-II
-        self.sourceRoot = buildDir.split("\\Build\\")[0]
+        self.sourceRoot = buildDir.split("/Build/")[0]
 
         if (self.IsInExclusiveList(moduleDir) == False):
             self.AddPackageList(moduleDir, self.usedPackageList)
@@ -101,14 +331,22 @@ class FileChecker:
         if packagePath not in packageList:
             packageList.append(packagePath)
 
+    #
+    # The package paths all end with "Pkg", so only the prefixes of file
+    # ending with "Pkg" need to be looked up
+    #
     def IsInPackageList(self, file):
-        for package in self.usedPackageList:
-            if file.find(package) != -1:
+        if len(self.usedPackageSet) != len(self.usedPackageList):
+            self.usedPackageSet = set(self.usedPackageList)
+        index = file.find("Pkg")
+        while index != -1:
+            if file[:index + 3] in self.usedPackageSet:
                 return True
+            index = file.find("Pkg", index + 1)
         return False
 
     def CheckUsedModule(self, file):
-        if (cmp (file[-8:], "Makefile") == 0) and (self.IsLibraryFile(file) == False):
+        if IsMakefile(file) and (self.IsLibraryFile(file) == False):
             finalDir = self.GetModulePathFromMakefile(file)
             if self.IsInExclusiveList(finalDir):
                 return ""
@@ -117,7 +355,7 @@ class FileChecker:
             return ""
             
     def CheckUsedLibrary(self, file):
-        if (cmp (file[-8:], "Makefile") == 0) and self.IsLibraryFile(file):
+        if IsMakefile(file) and self.IsLibraryFile(file):
             finalDir = self.GetModulePathFromMakefile(file)
             if self.IsInExclusiveList(finalDir):
                 return ""
@@ -126,7 +364,7 @@ class FileChecker:
             return ""
 
     def CheckMakefile(self, file):
-        if cmp (file[-8:], "Makefile") == 0:
+        if IsMakefile(file):
             finalDir = self.GetModulePathFromMakefile(file)
             if self.IsInExclusiveList(finalDir):
                 return ""
@@ -135,128 +373,77 @@ class FileChecker:
             return ""
 
     def ParseMakefile(self, fileName):
-        try :
-            file = open(fileName)
-        except Exception:
+        if fileName not in self.buildFileDict:
             print "fail to open " + fileName
             return
-        try:
-            while 1:
-                line = file.readline()
-                if not line:
-                    break
-                if cmp (line[0], "#") == 0:
-                    continue
-                newline = line[:-1]
-
-                #print "check - (" + newline + ")"
-                headFile = ""
-                #COMMON_DEPS = $(WORKSPACE)\MdePkg\Include\Protocol\DebugSupport.h \
-                #              $(WORKSPACE)\MdePkg\Include\Ppi\PciCfg2.h \
-                #$(OUTPUT_DIR)\X64\Semaphore.obj : $(WORKSPACE)\UefiCpuPkg\Include\Library\MtrrLib.h
-                #MatchString = "[\w\\\s\=\:\.\(\)\$]*\$\(WORKSPACE\)([\\\w]*\.h)[\\w\s]*"
-                MatchString1 = "(COMMON_DEPS = |              |\$\(OUTPUT_DIR\)[\\\\\w]*.obj : )\$\(WORKSPACE\)\\\\([\\\\\w]*\.h)"
-                match1 = re.match(MatchString1, newline)
-                if match1 is not None:
-                    #print "match1 - " + newline
-                    #print "0 - " + match1.group(0)
-                    #print "1 - " + match1.group(1)
-                    #print "2 - " + match1.group(2)
-                    headFile = match1.group(2)
-
-                if (cmp (headFile, "") != 0) and self.IsIncludeFile(headFile):
-                    finalPath = os.path.join (self.sourceRoot, headFile)
-                    if (self.IsInExclusiveList(finalPath) == False) and (finalPath not in self.usedIncludeFileList):
-                        self.usedIncludeFileList.append(finalPath)
-                        self.AddPackageList (finalPath, self.usedPackageList)
 
-        finally:
-            file.close()
+        # The header files of the Makefile are relative to $(WORKSPACE), the
+        # ones of the dependency files are full paths, which JoinPath keeps
+        # as they are
+        headList = list(self.buildFileDict[fileName][2])
+        for depsFile in self.depsFileDict.get(fileName, []):
+            headList.extend(self.buildFileDict[depsFile][2])
+
+        for headFile in headList:
+            if self.IsIncludeFile(headFile):
+                finalPath = JoinPath (self.sourceRoot, headFile)
+                if (self.IsInExclusiveList(finalPath) == False) and (finalPath not in self.usedIncludeFileSet):
+                    self.usedIncludeFileSet.add(finalPath)
+                    self.usedIncludeFileList.append(finalPath)
+                    self.AddPackageList (finalPath, self.usedPackageList)
 
         return
 
+    #
+    # One regular expression matching any of the strings of patternList, so
+    # a path is checked against the whole list in a single search
+    #
+    def GetPatternRe(self, patternList):
+        key = tuple(patternList)
+        if key not in self.patternReDict:
+            self.patternReDict[key] = re.compile("|".join([re.escape(pattern) for pattern in patternList]) or "(?!)")
+        return self.patternReDict[key]
+
     def IsInIncludeList(self, file):
-        for list in self.includeList:
-            result = file.find(list);
-            if (result != -1):
-                return True
-        return False
+        return self.GetPatternRe(self.includeList).search(file) is not None
 
     def IsInExclusiveList(self, file):
         if self.IsInIncludeList(file) == False:
             return True
-        for list in self.excluseList:
-            result = file.find(list);
-            if (result != -1):
-                return True
-        for list in self.excluseList:
-            full_file = file + "\\"
-            result = full_file.find(list);
-            if (result != -1):
-                return True
-        return False
+        full_file = file + "/"
+        return self.GetPatternRe(self.excluseList).search(full_file) is not None
 
     def IsFinalDir(self, file):
-        for s in os.listdir(file):
-            newFile=os.path.join(file,s)
-            if cmp (newFile[-4:], ".inf") == 0:
-                return True
-        return False
+        return file in self.finalDirSet
 
     def IsInUsedModuleList(self, file):
-        if file in self.usedModuleList:
-            return True
-        else:
-            return False
+        return file in self.usedModuleSet
 
     def IsInUsedLibraryList(self, file):
-        if file in self.usedLibraryList:
-            return True
-        else:
-            return False
+        return file in self.usedLibrarySet
 
+    #
+    # The module, library and package paths are all below sourceRoot, so a
+    # file belongs to one of them if one of its parent directories is in
+    # the set
+    #
     def IsUsedModule(self, file):
-        for used in self.usedModuleList:
-            final = used + "\\"
-            result = file.find(final);
-            if (result != -1):
-                return True
-        return False
-        
+        return self.usedModuleSet.HasParentOf(file)
+
     def IsUsedLibrary(self, file):
-        for used in self.usedLibraryList:
-            final = used + "\\"
-            result = file.find(final);
-            if (result != -1):
-                return True
-        return False
+        return self.usedLibrarySet.HasParentOf(file)
 
     def IsUnusedModule(self, file):
-        for unused in self.unusedModuleList:
-            final = unused + "\\"
-            result = file.find(final);
-            if (result != -1):
-                return True
-        return False
-        
+        return self.unusedModuleSet.HasParentOf(file)
+
     def IsUnusedLibrary(self, file):
-        for unused in self.unusedLibraryList:
-            final = unused + "\\"
-            result = file.find(final);
-            if (result != -1):
-                return True
-        return False
-        
+        return self.unusedLibrarySet.HasParentOf(file)
+
     def IsUnusedPackage(self, file):
-        for unused in self.unusedPackageList:
-            final = unused + "\\"
-            result = file.find(final);
-            if (result != -1):
-                return True
-        return False
+        return self.unusedPackageSet.HasParentOf(file)
 
     def CheckUnusedModule(self, file):
-        if os.path.isdir(file):
+        if self.IsDirEntry(file):
             if (self.IsInExclusiveList(file) == False) and self.IsFinalDir(file) and (self.IsInUsedModuleList(file) == False) and (self.IsLibraryFile(file) == False):
                 return file.decode('gbk')
             else:
@@ -265,7 +452,7 @@ class FileChecker:
             return ""
             
     def CheckUnusedLibrary(self, file):
-        if os.path.isdir(file):
+        if self.IsDirEntry(file):
             if (self.IsInExclusiveList(file) == False) and self.IsFinalDir(file) and (self.IsInUsedLibraryList(file) == False) and self.IsLibraryFile(file):
                 return file.decode('gbk')
             else:
@@ -274,7 +461,7 @@ class FileChecker:
             return ""
             
     def CheckAllModule(self, file):
-        if os.path.isdir(file):
+        if self.IsDirEntry(file):
             if (self.IsInExclusiveList(file) == False) and self.IsFinalDir(file) and (self.IsLibraryFile(file) == False):
                 return file.decode('gbk')
             else:
@@ -283,7 +470,7 @@ class FileChecker:
             return ""
             
     def CheckAllLibrary(self, file):
-        if os.path.isdir(file):
+        if self.IsDirEntry(file):
             if (self.IsInExclusiveList(file) == False) and self.IsFinalDir(file) and self.IsLibraryFile(file):
                 return file.decode('gbk')
             else:
@@ -292,7 +479,7 @@ class FileChecker:
             return ""
             
     def CheckAllDir(self, file):
-        if os.path.isdir(file):
+        if self.IsDirEntry(file):
             if (self.IsInExclusiveList(file) == False):
                 return file.decode('gbk')
             else:
@@ -301,7 +488,7 @@ class FileChecker:
             return ""
 
     def CheckAllModuleFile(self, file):
-        if os.path.isfile(file):
+        if self.IsFileEntry(file):
             if (self.IsInExclusiveList(file) == False) and (self.IsUsedModule(file) or self.IsUnusedModule(file)) and (self.IsLibraryFile(file) == False):
                 return file.decode('gbk')
             else:
@@ -310,7 +497,7 @@ class FileChecker:
             return ""
             
     def CheckAllLibraryFile(self, file):
-        if os.path.isfile(file):
+        if self.IsFileEntry(file):
             if (self.IsInExclusiveList(file) == False) and (self.IsUsedLibrary(file) or self.IsUnusedLibrary(file)) and self.IsLibraryFile(file):
                 return file.decode('gbk')
             else:
@@ -319,7 +506,7 @@ class FileChecker:
             return ""
             
     def CheckAllFile(self, file):
-        if os.path.isfile(file):
+        if self.IsFileEntry(file):
             if (self.IsInExclusiveList(file) == False):
                 return file.decode('gbk')
             else:
@@ -328,7 +515,7 @@ class FileChecker:
             return ""
             
     def CheckUsedModuleFile(self, file):
-        if os.path.isfile(file):
+        if self.IsFileEntry(file):
             if (self.IsInExclusiveList(file) == False) and self.IsUsedModule(file):
                 return file.decode('gbk')
             else:
@@ -337,7 +524,7 @@ class FileChecker:
             return ""
             
     def CheckUsedLibraryFile(self, file):
-        if os.path.isfile(file):
+        if self.IsFileEntry(file):
             if (self.IsInExclusiveList(file) == False) and self.IsUsedLibrary(file):
                 return file.decode('gbk')
             else:
@@ -346,7 +533,7 @@ class FileChecker:
             return ""
             
     def CheckUnusedModuleFile(self, file):
-        if os.path.isfile(file):
+        if self.IsFileEntry(file):
             if (self.IsInExclusiveList(file) == False) and self.IsUnusedModule(file):
                 return file.decode('gbk')
             else:
@@ -355,7 +542,7 @@ class FileChecker:
             return ""
             
     def CheckUnusedLibraryFile(self, file):
-        if os.path.isfile(file):
+        if self.IsFileEntry(file):
             if (self.IsInExclusiveList(file) == False) and self.IsUnusedLibrary(file):
                 return file.decode('gbk')
             else:
@@ -364,7 +551,7 @@ class FileChecker:
             return ""
             
     def CheckUnusedPackageFile(self, file):
-        if os.path.isfile(file):
+        if self.IsFileEntry(file):
             if (self.IsInExclusiveList(file) == False) and self.IsUnusedPackage(file):
                 return file.decode('gbk')
             else:
@@ -372,17 +559,112 @@ class FileChecker:
         else:
             return ""
             
+    def IsDirEntry(self, file):
+        if file in self.entryIsDir:
+            return self.entryIsDir[file]
+        return os.path.isdir(file)
+
+    def IsFileEntry(self, file):
+        if file in self.entryIsDir:
+            return not self.entryIsDir[file]
+        return os.path.isfile(file)
+
+    def LoadInventory(self, dir):
+        self.inventoryFile = os.path.join(dir, INVENTORY_CACHE_FILE)
+        self.cachedDirDict = {}
+        try:
+            # paths are byte strings, latin-1 round-trips any of them
+            with open(self.inventoryFile) as file:
+                index = json.load(file, encoding = "latin-1")
+            if index["Version"] == INVENTORY_CACHE_VERSION:
+                for dirName in index["Dirs"]:
+                    (mtime, entryList) = index["Dirs"][dirName]
+                    self.cachedDirDict[dirName.encode("latin-1")] = [mtime, [(name.encode("latin-1"), isDir, entryTime) for (name, isDir, entryTime) in entryList]]
+        except (EnvironmentError, ValueError, KeyError, TypeError):
+            self.cachedDirDict = {}
+
+    def SaveInventory(self):
+        if (cmp (self.inventoryFile, "") == 0) or (self.dirDict == self.cachedDirDict):
+            return
+        try:
+            with open(self.inventoryFile, "w") as file:
+                json.dump({"Version" : INVENTORY_CACHE_VERSION, "Dirs" : self.dirDict}, file, encoding = "latin-1")
+        except EnvironmentError:
+            pass
+
+    #
+    # List dir as (name, isDir, mtime) entries, the types and times come from
+    # the directory listing itself when scandir is available
+    #
+    def ScanDir(self, dir):
+        entryList = []
+        if scandir is not None:
+            for entry in scandir(dir):
+                try:
+                    entryList.append((entry.name, entry.is_dir(), entry.stat().st_mtime))
+                except OSError:
+                    continue
+        else:
+            for name in os.listdir(dir):
+                try:
+                    statinfo = os.stat(os.path.join(dir, name))
+                except OSError:
+                    continue
+                entryList.append((name, stat.S_ISDIR(statinfo.st_mode), statinfo.st_mtime))
+        return entryList
+
+    def ListDir(self, dir):
+        try:
+            mtime = os.stat(dir).st_mtime
+        except OSError:
+            return []
+        cached = self.dirDict.get(dir) or self.cachedDirDict.get(dir)
+        if (cached is not None) and (cached[0] == mtime):
+            entryList = cached[1]
+        else:
+            entryList = self.ScanDir(dir)
+        self.dirDict[dir] = [mtime, entryList]
+        return entryList
+
+    def WalkDir(self, dir, inventory):
+        for (name, isDir, mtime) in self.ListDir(dir):
+            if (cmp (name, INVENTORY_CACHE_FILE) == 0) or (cmp (name, USED_INDEX_FILE) == 0):
+                continue
+            newDir = JoinPath(dir,name)
+            inventory.append(newDir)
+            self.entryIsDir[newDir] = isDir
+            if cmp (newDir[-4:], ".inf") == 0:
+                self.finalDirSet.add(dir)
+            if isDir:
+                self.WalkDir(newDir, inventory)
+
+    #
+    # All the paths under dir, dir first, in the order of a recursive walk.
+    # Each tree is walked once, later calls reuse the inventory.
+    #
+    def GetInventory(self, dir):
+        if dir not in self.inventoryDict:
+            inventory = [dir]
+            self.entryIsDir[dir] = os.path.isdir(dir)
+            if self.entryIsDir[dir]:
+                self.WalkDir(dir, inventory)
+            self.inventoryDict[dir] = inventory
+        return self.inventoryDict[dir]
+
+    def ResetInventory(self):
+        self.inventoryDict = {}
+        self.entryIsDir = {}
+        self.finalDirSet = set()
+
     def GetFileList(self, dir, fileList, checkFunc):
-        newDir = dir
-        AppendName = checkFunc (dir)
-        if cmp (AppendName, "") != 0:
-            #print "AppendName = " + AppendName
-            if AppendName not in fileList:
-                fileList.append(AppendName)
-        if os.path.isdir(dir):  
-            for sub in os.listdir(dir):
-                newDir = os.path.join(dir,sub)
-                self.GetFileList(newDir, fileList, checkFunc)  
+        fileSet = set(fileList)
+        for newDir in self.GetInventory(dir):
+            AppendName = checkFunc (newDir)
+            if cmp (AppendName, "") != 0:
+                #print "AppendName = " + AppendName
+                if AppendName not in fileSet:
+                    fileSet.add(AppendName)
+                    fileList.append(AppendName)
         return fileList
 
     def DeleteEmptyDir(self, dir):
@@ -437,6 +719,16 @@ class FileChecker:
             print file
         print "  Count - " + str(len(fileList))
 
+    #
+    # Print each file followed by the build directories using it
+    #
+    def PrintUsedByList(self, fileList):
+        for file in fileList:
+            print file
+            for buildDir in self.usedByDict[file]:
+                print "    " + buildDir
+        print "  Count - " + str(len(fileList))
+
     def SortFileList(self, fileList):
         fileList.sort()
             
@@ -445,31 +737,132 @@ class FileChecker:
             print file
             self.PrintFileTime(file)
 
+    def LoadIndex(self):
+        try:
+            with open(self.indexFile) as file:
+                index = JsonToStr(json.load(file, encoding = "latin-1"))
+            if index["Version"] == USED_INDEX_VERSION:
+                return index["Builds"]
+        except (EnvironmentError, ValueError, KeyError, TypeError):
+            pass
+        return {}
+
+    def SaveIndex(self, buildRecordDict):
+        try:
+            with open(self.indexFile, "w") as file:
+                json.dump({"Version" : USED_INDEX_VERSION, "Builds" : buildRecordDict}, file, encoding = "latin-1", sort_keys = True)
+        except EnvironmentError:
+            print "fail to write " + self.indexFile
+
+    #
+    # A build directory is harvested again when any of its build files, or
+    # the include and exclude lists, change. The build files are stat'ed as
+    # the inventory only tracks the time of the directories. Their paths are
+    # relative to buildDir, so the stamp does not depend on the current dir.
+    #
+    def GetBuildStamp(self, buildDir):
+        stamp = hashlib.md5()
+        stamp.update(repr(self.includeList) + repr(self.excluseList))
+        for file in sorted(self.GetBuildFileList(buildDir)):
+            try:
+                mtime = os.stat(file).st_mtime
+            except EnvironmentError:
+                mtime = None
+            stamp.update("%s|%r\n" % (file[len(buildDir):], mtime))
+        return stamp.hexdigest()
+
+    #
+    # Used modules, libraries, include files and packages of one build
+    # directory, its build files must have been parsed
+    #
+    def HarvestBuild(self, buildDir):
+        self.usedPackageList = []
+        self.usedIncludeFileList = []
+        self.usedIncludeFileSet = set()
+
+        moduleList  = self.GetFileList(buildDir, [], self.CheckUsedModule)
+        libraryList = self.GetFileList(buildDir, [], self.CheckUsedLibrary)
+        for file in self.GetFileList(buildDir, [], self.CheckMakefile):
+            self.ParseMakefile(file)
+
+        return {
+            "SourceRoot"   : self.sourceRoot,
+            "Modules"      : moduleList,
+            "Libraries"    : libraryList,
+            "IncludeFiles" : self.usedIncludeFileList,
+            "Packages"     : self.usedPackageList
+            }
+
+    #
+    # The used lists are the union of the used lists of all the build
+    # directories. The builds whose build files did not change since the
+    # last run are taken from the index, the other ones are harvested, with
+    # all their build files parsed in one process pool. The index is keyed
+    # by the absolute build directory, so a build checked from another
+    # directory is found again.
+    #
+    def GetUsedBuildList(self):
+        if self.buildRecordDict is not None:
+            return
+
+        indexDict = self.LoadIndex()
+        stampDict = {}
+        harvestList = []
+        for buildDir in self.buildDirList:
+            key = AbsPath(buildDir)
+            stampDict[buildDir] = self.GetBuildStamp(buildDir)
+            if (key not in indexDict) or (indexDict[key].get("Stamp") != stampDict[buildDir]):
+                harvestList.append(buildDir)
+
+        self.ParseBuildFiles(harvestList)
+
+        self.buildRecordDict = {}
+        for buildDir in self.buildDirList:
+            key = AbsPath(buildDir)
+            if buildDir in harvestList:
+                print "harvesting - " + buildDir
+                record = self.HarvestBuild(buildDir)
+                record["Stamp"] = stampDict[buildDir]
+                indexDict[key] = record
+            self.buildRecordDict[buildDir] = indexDict[key]
+
+        self.usedModuleList = []
+        self.usedLibraryList = []
+        self.usedIncludeFileList = []
+        self.usedPackageList = []
+        self.usedByDict = {}
+        for buildDir in self.buildDirList:
+            record = self.buildRecordDict[buildDir]
+            if cmp (record["SourceRoot"], "") != 0:
+                if (cmp (self.sourceRoot, "") != 0) and (cmp (self.sourceRoot, record["SourceRoot"]) != 0):
+                    print "WARNING: " + buildDir + " is a build of " + record["SourceRoot"] + ", not of " + self.sourceRoot
+                self.sourceRoot = record["SourceRoot"]
+            for (key, usedList) in [("Modules", self.usedModuleList), ("Libraries", self.usedLibraryList), ("IncludeFiles", self.usedIncludeFileList), ("Packages", self.usedPackageList)]:
+                for file in record[key]:
+                    if file not in self.usedByDict:
+                        self.usedByDict[file] = []
+                        usedList.append(file)
+                    if buildDir not in self.usedByDict[file]:
+                        self.usedByDict[file].append(buildDir)
+
+        self.SortFileList(self.usedModuleList)
+        self.SortFileList(self.usedLibraryList)
+        self.SortFileList(self.usedIncludeFileList)
+        self.usedModuleSet = DirSet(self.usedModuleList)
+        self.usedLibrarySet = DirSet(self.usedLibraryList)
+        self.usedIncludeFileSet = set(self.usedIncludeFileList)
+
+        if len(harvestList) != 0:
+            self.SaveIndex(indexDict)
+
     def GetUsedModuleList(self):
-        if (len(self.usedModuleList) == 0):
-            self.usedModuleList = self.GetFileList(sys.argv[1], [], self.CheckUsedModule)
-            self.SortFileList(self.usedModuleList)
+        self.GetUsedBuildList()
             
     def GetUsedLibraryList(self):
-        if (len(self.usedLibraryList) == 0):
-            self.usedLibraryList = self.GetFileList(sys.argv[1], [], self.CheckUsedLibrary)
-            self.SortFileList(self.usedLibraryList)
-
-    def GetMakefileList(self):
-        if (len(self.makefileList) == 0):
-            self.GetUsedModuleList()
-            self.makefileList = self.GetFileList(sys.argv[1], [], self.CheckMakefile)
+        self.GetUsedBuildList()
 
     def GetUsedIncludeFileList(self):
-        if (len(self.usedIncludeFileList) == 0):
-            self.GetMakefileList()
-
-            #print "\nMakefile:"
-            #fileChecker.PrintFileList (fileChecker.makefileList)
-
-            for file in self.makefileList:
-                self.ParseMakefile(file)
-            self.SortFileList(self.usedIncludeFileList)
+        self.GetUsedBuildList()
 
     def GetUsedModuleFileList(self):
         if (len(self.usedModuleFileList) == 0):
@@ -491,8 +884,9 @@ class FileChecker:
             self.GetUnusedFileList()
 
             self.usedFileList = []
+            unusedFileSet = set(self.unusedFileList)
             for file in self.allFileList:
-                if (file not in self.unusedFileList) and self.IsInPackageList(file):
+                if (file not in unusedFileSet) and self.IsInPackageList(file):
                     self.usedFileList.append(file)
             
             self.SortFileList(self.usedFileList)
@@ -552,7 +946,7 @@ class FileChecker:
             self.GetAllFileList()
             prefixLength = len(self.sourceRoot)
             for file in self.allFileList:
-                finalPath = os.path.join (self.sourceRoot, file[prefixLength + 1:])
+                finalPath = JoinPath (self.sourceRoot, file[prefixLength + 1:])
                 self.AddPackageList(finalPath, self.allPackageList)
             self.SortFileList(self.allPackageList)
 
@@ -561,12 +955,14 @@ class FileChecker:
             self.GetUsedModuleList()
 
             self.unusedModuleList = self.GetFileList(self.sourceRoot, [], self.CheckUnusedModule)
+            self.unusedModuleSet = DirSet(self.unusedModuleList)
             
     def GetUnusedLibraryList(self):
         if (len(self.unusedLibraryList) == 0):
             self.GetUsedLibraryList()
 
             self.unusedLibraryList = self.GetFileList(self.sourceRoot, [], self.CheckUnusedLibrary)
+            self.unusedLibrarySet = DirSet(self.unusedLibraryList)
 
     def GetUnusedIncludeFileList(self):
         if (len(self.unusedIncludeFileList) == 0):
@@ -575,7 +971,7 @@ class FileChecker:
 
             self.unusedIncludeFileList = []
             for file in self.allIncludeFileList:
-                if file not in self.usedIncludeFileList:
+                if file not in self.usedIncludeFileSet:
                     self.unusedIncludeFileList.append(file)
 
             self.SortFileList(self.unusedIncludeFileList)
@@ -608,8 +1004,10 @@ class FileChecker:
             self.unusedFileList.extend(self.unusedModuleFileList)
             self.unusedFileList.extend(self.unusedLibraryFileList)
             
+            unusedFileSet = set(self.unusedFileList)
             for file in self.unusedPackageFileList:
-                if file not in self.unusedFileList:
+                if file not in unusedFileSet:
+                    unusedFileSet.add(file)
                     self.unusedFileList.append(file)
 
             self.SortFileList(self.unusedFileList)
@@ -619,19 +1017,22 @@ class FileChecker:
             self.GetUsedPackageList()
             self.GetAllPackageList()
 
+            usedPackageSet = set(self.usedPackageList)
             for package in self.allPackageList:
-                if package not in self.usedPackageList:
+                if package not in usedPackageSet:
                     self.unusedPackageList.append(package)
             self.SortFileList(self.unusedPackageList)
+            self.unusedPackageSet = DirSet(self.unusedPackageList)
 
 #
 #  Print out the usage
 #
 def usage():
-    print "Usage: \n\tCheckCodeBase <Build Dir> used|unused|all"
+    print "Usage: \n\tCheckCodeBase [--config <Config File>] [--index <Index File>] <Build Dir>... used|unused|all|usedby"
     print "       used - used library, modules, include file, library files, module files, all used files"
     print "       unused - unused library, modules, include file, library files, module files, all unused files"
     print "       all - all library, modules, include file, library files, module files, all files"
+    print "       usedby - used library, modules, include file, with the build directories using each of them"
     print "  library      : the directory of a library"
     print "  module       : the directory of a driver"
     print "  include file : the header files in include directory"
@@ -639,18 +1040,61 @@ def usage():
     print "  module file  : all files in a driver directory"
     print "  all file     : all files in project, including any other metadata files or batch files"
     #print "Usage: \n\tCheckCodeBase <Build Dir> time|touch"
+    print "  Config File  : [CheckCodeBase] section with the IncludeList and ExcludeList path patterns"
+    print "  Index File   : used files of each build directory, default Build/" + USED_INDEX_FILE + " of the workspace"
+    print "  Build Dir    : one or more build directories or wildcards, the used files are the union of all of them"
     print "For Example: \n\tCheckCodeBase Build\KabylakeOpenBoardPkg\KabylakeRvp3\DEBUG_VS2015x86 used"
+    print "\tCheckCodeBase Build/KabylakeOpenBoardPkg/KabylakeRvp3/DEBUG_GCC5 used"
+    print "\tCheckCodeBase Build/*OpenBoardPkg/*/DEBUG_VS2015x86 unused"
 
 def main():
     global FileChecker
 
     fileChecker = FileChecker()
 
-    if len(sys.argv) < 3:
+    argList = sys.argv[1:]
+    optionDict = {}
+    for option in ["--config", "--index"]:
+        if option in argList:
+            index = argList.index(option)
+            value = argList[index + 1:index + 2]
+            del argList[index:index + 2]
+            if len(value) == 0:
+                usage()
+                return 1
+            optionDict[option] = value[0]
+
+    if len(argList) < 2:
         usage()
         return 1
 
-    if cmp (sys.argv[2], "used") == 0:
+    for arg in argList[:-1]:
+        for buildDir in sorted(glob.glob(arg)) or [arg]:
+            buildDir = NormPath(buildDir)
+            if buildDir not in fileChecker.buildDirList:
+                fileChecker.buildDirList.append(buildDir)
+    mode = argList[-1]
+
+    if ("--config" in optionDict) and (fileChecker.LoadConfig (optionDict["--config"]) == False):
+        return 1
+    if "--index" in optionDict:
+        fileChecker.indexFile = optionDict["--index"]
+    else:
+        fileChecker.indexFile = GetDefaultIndexFile (fileChecker.buildDirList[0])
+
+    fileChecker.LoadInventory (fileChecker.buildDirList[0])
+
+    for buildDir in fileChecker.buildDirList:
+        if not os.path.isdir(buildDir):
+            print "Build Dir not found - " + buildDir
+            usage()
+            return 1
+        if len([file for file in fileChecker.GetBuildFileList(buildDir) if IsMakefile(file)]) == 0:
+            print "No Makefile in Build Dir - " + buildDir
+            usage()
+            return 1
+
+    if cmp (mode, "used") == 0:
         fileChecker.GetUsedModuleList ()
         print "\n  Used Module List:"
         fileChecker.PrintFileList (fileChecker.usedModuleList)
@@ -687,7 +1131,26 @@ def main():
         print "  Library File Count - " + str(len(fileChecker.usedLibraryFileList))
         print "  All File Count     - " + str(len(fileChecker.usedFileList))
 
-    elif cmp (sys.argv[2], "all") == 0:
+    elif cmp (mode, "usedby") == 0:
+        fileChecker.GetUsedBuildList ()
+        print "\n  Used Module List:"
+        fileChecker.PrintUsedByList (fileChecker.usedModuleList)
+
+        print "\n  Used Library List:"
+        fileChecker.PrintUsedByList (fileChecker.usedLibraryList)
+
+        print "\n Used Include File List:"
+        fileChecker.PrintUsedByList (fileChecker.usedIncludeFileList)
+
+        print "\n  ==== Used By Summary ===="
+        for buildDir in fileChecker.buildDirList:
+            record = fileChecker.buildRecordDict[buildDir]
+            print "  " + buildDir
+            print "    Module Count       - " + str(len(record["Modules"]))
+            print "    Library Count      - " + str(len(record["Libraries"]))
+            print "    Include File Count - " + str(len(record["IncludeFiles"]))
+
+    elif cmp (mode, "all") == 0:
         fileChecker.GetAllModuleList()
         print "\n All Module List:"
         fileChecker.PrintFileList (fileChecker.allModuleList)
@@ -724,7 +1187,7 @@ def main():
         print "  Library File Count - " + str(len(fileChecker.allLibraryFileList))
         print "  All File Count     - " + str(len(fileChecker.allFileList))
         
-    elif cmp (sys.argv[2], "unused") == 0:
+    elif cmp (mode, "unused") == 0:
         fileChecker.GetUnusedModuleList()
         print "\n Unused Module List:"
         fileChecker.PrintFileList (fileChecker.unusedModuleList)
@@ -761,7 +1224,7 @@ def main():
         print "  Library File Count - " + str(len(fileChecker.unusedLibraryFileList))
         print "  All File Count     - " + str(len(fileChecker.unusedFileList))
 
-    elif cmp (sys.argv[2], "delete_unused") == 0:
+    elif cmp (mode, "delete_unused") == 0:
         fileChecker.GetUnusedModuleList()
         fileChecker.GetUnusedLibraryList()
         fileChecker.GetUnusedIncludeFileList()
@@ -772,18 +1235,23 @@ def main():
         fileChecker.DeleteUnusedFile(fileChecker.unusedLibraryList)
         fileChecker.DeleteUnusedFile(fileChecker.unusedIncludeFileList)
 
+        fileChecker.ResetInventory()
         fileChecker.allDirList = fileChecker.GetFileList(fileChecker.sourceRoot, [], fileChecker.CheckAllDir)
         fileChecker.DeleteEmptyDirList(fileChecker.allDirList)
 
-    elif cmp (sys.argv[2], "time") == 0:
-        fileChecker.allDirList = fileChecker.GetFileList(sys.argv[1], [], fileChecker.CheckFile)
-        fileChecker.PrintFileListTime(fileChecker.allDirList)
+    elif cmp (mode, "time") == 0:
+        for buildDir in fileChecker.buildDirList:
+            fileChecker.allDirList = fileChecker.GetFileList(buildDir, [], fileChecker.CheckFile)
+            fileChecker.PrintFileListTime(fileChecker.allDirList)
         
-    elif cmp (sys.argv[2], "touch") == 0:
-        fileChecker.allDirList = fileChecker.GetFileList(sys.argv[1], [], fileChecker.CheckFile)
-        fileChecker.TouchFileListTime(fileChecker.allDirList)
+    elif cmp (mode, "touch") == 0:
+        for buildDir in fileChecker.buildDirList:
+            fileChecker.allDirList = fileChecker.GetFileList(buildDir, [], fileChecker.CheckFile)
+            fileChecker.TouchFileListTime(fileChecker.allDirList)
     else:
-        print "Unknown - " + sys.argv[2]
+        print "Unknown - " + mode
+
+    fileChecker.SaveInventory ()
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,838 @@
+## @ FvLib.py
+#
+# Firmware volume, FFS file, section and PE/TE image definitions shared by
+# the PatchFv tools.
+#
+# Copyright (c) 2017 - 2019, Intel Corporation. All rights reserved.<BR>
+# SPDX-License-Identifier: BSD-2-Clause-Patent
+#
+
+import struct
+import hashlib
+from   ctypes import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class GUID(Structure):
+    _fields_ = [
+        ('Guid1',            c_uint32),
+        ('Guid2',            c_uint16),
+        ('Guid3',            c_uint16),
+        ('Guid4',            ARRAY(c_uint8, 8)),
+        ]
+
+
+class EFI_FIRMWARE_VOLUME_HEADER(Structure):
+    _fields_ = [
+        ('ZeroVector',           ARRAY(c_uint8, 16)),
+        ('FileSystemGuid',       GUID),
+        ('FvLength',             c_uint64),
+        ('Signature',            c_uint32),
+        ('Attributes',           c_uint32),
+        ('HeaderLength',         c_uint16),
+        ('Checksum',             c_uint16),
+        ('ExtHeaderOffset',      c_uint16),
+        ('Reserved',             c_uint8),
+        ('Revision',             c_uint8),
+        ]
+
+class EFI_FIRMWARE_VOLUME_EXT_HEADER(Structure):
+    _fields_ = [
+        ('FvName',               GUID),
+        ('ExtHeaderSize',        c_uint32),
+        ]
+
+#
+# File Types Definitions
+#
+EFI_FV_FILETYPE_ALL                   = 0x00
+EFI_FV_FILETYPE_RAW                   = 0x01
+EFI_FV_FILETYPE_FREEFORM              = 0x02
+EFI_FV_FILETYPE_SECURITY_CORE         = 0x03
+EFI_FV_FILETYPE_PEI_CORE              = 0x04
+EFI_FV_FILETYPE_DXE_CORE              = 0x05
+EFI_FV_FILETYPE_PEIM                  = 0x06
+EFI_FV_FILETYPE_DRIVER                = 0x07
+EFI_FV_FILETYPE_COMBINED_PEIM_DRIVER  = 0x08
+EFI_FV_FILETYPE_APPLICATION           = 0x09
+EFI_FV_FILETYPE_SMM                   = 0x0A
+EFI_FV_FILETYPE_FIRMWARE_VOLUME_IMAGE = 0x0B
+EFI_FV_FILETYPE_COMBINED_SMM_DXE      = 0x0C
+EFI_FV_FILETYPE_SMM_CORE              = 0x0D
+EFI_FV_FILETYPE_OEM_MIN               = 0xc0
+EFI_FV_FILETYPE_OEM_MAX               = 0xdf
+EFI_FV_FILETYPE_DEBUG_MIN             = 0xe0
+EFI_FV_FILETYPE_DEBUG_MAX             = 0xef
+EFI_FV_FILETYPE_FFS_MIN               = 0xf0
+EFI_FV_FILETYPE_FFS_MAX               = 0xff
+EFI_FV_FILETYPE_FFS_PAD               = 0xf0
+#
+# FFS File Attributes.
+#
+FFS_ATTRIB_LARGE_FILE         = 0x01
+FFS_ATTRIB_DATA_ALIGNMENT_2   = 0x02
+FFS_ATTRIB_FIXED              = 0x04
+FFS_ATTRIB_DATA_ALIGNMENT     = 0x38
+FFS_ATTRIB_CHECKSUM           = 0x40
+
+#
+# FFS File State Bits.
+#
+EFI_FILE_HEADER_CONSTRUCTION  = 0x01
+EFI_FILE_HEADER_VALID         = 0x02
+EFI_FILE_DATA_VALID           = 0x04
+EFI_FILE_MARKED_FOR_UPDATE    = 0x08
+EFI_FILE_DELETED              = 0x10
+EFI_FILE_HEADER_INVALID       = 0x20
+
+class EFI_FFS_FILE_HEADER(Structure):
+    _fields_ = [
+        ('Name',                 GUID),
+        ('IntegrityCheck',       c_uint16),
+        ('Type',                 c_uint8),
+        ('Attributes',           c_uint8),
+        ('Size',                 ARRAY(c_uint8, 3)),
+        ('State',                c_uint8),
+        ]
+
+class EFI_FFS_FILE_HEADER2(Structure):
+    _fields_ = [
+        ('Name',                 GUID),
+        ('IntegrityCheck',       c_uint16),
+        ('Type',                 c_uint8),
+        ('Attributes',           c_uint8),
+        ('Size',                 ARRAY(c_uint8, 3)),
+        ('State',                c_uint8),
+        ('ExtendedSize',         c_uint64),
+        ]
+
+#
+# Pseudo type. It is used as a wild card when retrieving sections.
+#  The section type EFI_SECTION_ALL matches all section types.
+#
+EFI_SECTION_ALL                   = 0x00
+
+#
+# Encapsulation section Type values.
+#
+EFI_SECTION_COMPRESSION           = 0x01
+
+EFI_SECTION_GUID_DEFINED          = 0x02
+
+EFI_SECTION_DISPOSABLE            = 0x03
+
+#
+# Leaf section Type values.
+#
+EFI_SECTION_PE32                  = 0x10
+EFI_SECTION_PIC                   = 0x11
+EFI_SECTION_TE                    = 0x12
+EFI_SECTION_DXE_DEPEX             = 0x13
+EFI_SECTION_VERSION               = 0x14
+EFI_SECTION_USER_INTERFACE        = 0x15
+EFI_SECTION_COMPATIBILITY16       = 0x16
+EFI_SECTION_FIRMWARE_VOLUME_IMAGE = 0x17
+EFI_SECTION_FREEFORM_SUBTYPE_GUID = 0x18
+EFI_SECTION_RAW                   = 0x19
+EFI_SECTION_PEI_DEPEX             = 0x1B
+EFI_SECTION_SMM_DEPEX             = 0x1C
+
+class EFI_COMMON_SECTION_HEADER(Structure):
+    _fields_ = [
+        ('Size',                 ARRAY(c_uint8, 3)),
+        ('Type',                 c_uint8),
+        ]
+
+class EFI_COMMON_SECTION_HEADER2(Structure):
+    _fields_ = [
+        ('Size',                 ARRAY(c_uint8, 3)),
+        ('Type',                 c_uint8),
+        ('ExtendedSize',         c_uint32),
+        ]
+
+#
+# Encapsulation section headers
+#
+EFI_NOT_COMPRESSED                      = 0x00
+EFI_GUIDED_SECTION_PROCESSING_REQUIRED  = 0x01
+
+class EFI_COMPRESSION_SECTION(Structure):
+    _pack_   = 1
+    _fields_ = [
+        ('CommonHeader',         EFI_COMMON_SECTION_HEADER),
+        ('UncompressedLength',   c_uint32),
+        ('CompressionType',      c_uint8),
+        ]
+
+class EFI_COMPRESSION_SECTION2(Structure):
+    _pack_   = 1
+    _fields_ = [
+        ('CommonHeader',         EFI_COMMON_SECTION_HEADER2),
+        ('UncompressedLength',   c_uint32),
+        ('CompressionType',      c_uint8),
+        ]
+
+class EFI_GUID_DEFINED_SECTION(Structure):
+    _fields_ = [
+        ('CommonHeader',         EFI_COMMON_SECTION_HEADER),
+        ('SectionDefinitionGuid', GUID),
+        ('DataOffset',           c_uint16),
+        ('Attributes',           c_uint16),
+        ]
+
+class EFI_GUID_DEFINED_SECTION2(Structure):
+    _fields_ = [
+        ('CommonHeader',         EFI_COMMON_SECTION_HEADER2),
+        ('SectionDefinitionGuid', GUID),
+        ('DataOffset',           c_uint16),
+        ('Attributes',           c_uint16),
+        ]
+
+
+class EFI_FV_FILETYPE:
+    ALL                        = 0x00
+    RAW                        = 0x01
+    FREEFORM                   = 0x02
+    SECURITY_CORE              = 0x03
+    PEI_CORE                   = 0x04
+    DXE_CORE                   = 0x05
+    PEIM                       = 0x06
+    DRIVER                     = 0x07
+    COMBINED_PEIM_DRIVER       = 0x08
+    APPLICATION                = 0x09
+    SMM                        = 0x0a
+    FIRMWARE_VOLUME_IMAGE      = 0x0b
+    COMBINED_SMM_DXE           = 0x0c
+    SMM_CORE                   = 0x0d
+    OEM_MIN                    = 0xc0
+    OEM_MAX                    = 0xdf
+    DEBUG_MIN                  = 0xe0
+    DEBUG_MAX                  = 0xef
+    FFS_MIN                    = 0xf0
+    FFS_MAX                    = 0xff
+    FFS_PAD                    = 0xf0
+
+class EFI_SECTION_TYPE:
+    ALL                        = 0x00
+    COMPRESSION                = 0x01
+    GUID_DEFINED               = 0x02
+    DISPOSABLE                 = 0x03
+    PE32                       = 0x10
+    PIC                        = 0x11
+    TE                         = 0x12
+    DXE_DEPEX                  = 0x13
+    VERSION                    = 0x14
+    USER_INTERFACE             = 0x15
+    COMPATIBILITY16            = 0x16
+    FIRMWARE_VOLUME_IMAGE      = 0x17
+    FREEFORM_SUBTYPE_GUID      = 0x18
+    RAW                        = 0x19
+    PEI_DEPEX                  = 0x1b
+    SMM_DEPEX                  = 0x1c
+
+IMAGE_FILE_MACHINE_I386           = 0x014c
+IMAGE_FILE_MACHINE_X64            = 0x8664
+
+EFI_IMAGE_DIRECTORY_ENTRY_BASERELOC   = 5
+
+class EFI_IMAGE_DOS_HEADER(Structure):
+    _fields_ = [
+        ('e_magic',              c_uint16),
+        ('e_cblp',               c_uint16),
+        ('e_cp',                 c_uint16),
+        ('e_crlc',               c_uint16),
+        ('e_cparhdr',            c_uint16),
+        ('e_minalloc',           c_uint16),
+        ('e_maxalloc',           c_uint16),
+        ('e_ss',                 c_uint16),
+        ('e_sp',                 c_uint16),
+        ('e_csum',               c_uint16),
+        ('e_ip',                 c_uint16),
+        ('e_cs',                 c_uint16),
+        ('e_lfarlc',             c_uint16),
+        ('e_ovno',               c_uint16),
+        ('e_res',                ARRAY(c_uint16, 4)),
+        ('e_oemid',              c_uint16),
+        ('e_oeminfo',            c_uint16),
+        ('e_res2',               ARRAY(c_uint16, 10)),
+        ('e_lfanew',             c_uint16)
+        ]
+
+class EFI_IMAGE_DATA_DIRECTORY(Structure):
+    _fields_ = [
+        ('VirtualAddress',       c_uint32),
+        ('Size',                 c_uint32)
+        ]
+
+class EFI_IMAGE_FILE_HEADER(Structure):
+    _fields_ = [
+        ('Machine',               c_uint16),
+        ('NumberOfSections',      c_uint16),
+        ('TimeDateStamp',         c_uint32),
+        ('PointerToSymbolTable',  c_uint32),
+        ('NumberOfSymbols',       c_uint32),
+        ('SizeOfOptionalHeader',  c_uint16),
+        ('Characteristics',       c_uint16)
+        ]
+
+class EFI_IMAGE_OPTIONAL_HEADER32(Structure):
+    _fields_ = [
+        ('Magic',                         c_uint16),
+        ('MajorLinkerVersion',            c_uint8),
+        ('MinorLinkerVersion',            c_uint8),
+        ('SizeOfCode',                    c_uint32),
+        ('SizeOfInitializedData',         c_uint32),
+        ('SizeOfUninitializedData',       c_uint32),
+        ('AddressOfEntryPoint',           c_uint32),
+        ('BaseOfCode',                    c_uint32),
+        ('BaseOfData',                    c_uint32),
+        ('ImageBase',                     c_uint32),
+        ('SectionAlignment',              c_uint32),
+        ('FileAlignment',                 c_uint32),
+        ('MajorOperatingSystemVersion',   c_uint16),
+        ('MinorOperatingSystemVersion',   c_uint16),
+        ('MajorImageVersion',             c_uint16),
+        ('MinorImageVersion',             c_uint16),
+        ('MajorSubsystemVersion',         c_uint16),
+        ('MinorSubsystemVersion',         c_uint16),
+        ('Win32VersionValue',             c_uint32),
+        ('SizeOfImage',                   c_uint32),
+        ('SizeOfHeaders',                 c_uint32),
+        ('CheckSum'     ,                 c_uint32),
+        ('Subsystem',                     c_uint16),
+        ('DllCharacteristics',            c_uint16),
+        ('SizeOfStackReserve',            c_uint32),
+        ('SizeOfStackCommit' ,            c_uint32),
+        ('SizeOfHeapReserve',             c_uint32),
+        ('SizeOfHeapCommit' ,             c_uint32),
+        ('LoaderFlags'     ,              c_uint32),
+        ('NumberOfRvaAndSizes',           c_uint32),
+        ('DataDirectory',                 ARRAY(EFI_IMAGE_DATA_DIRECTORY, 16))
+        ]
+
+class EFI_IMAGE_OPTIONAL_HEADER64(Structure):
+    _fields_ = [
+        ('Magic',                         c_uint16),
+        ('MajorLinkerVersion',            c_uint8),
+        ('MinorLinkerVersion',            c_uint8),
+        ('SizeOfCode',                    c_uint32),
+        ('SizeOfInitializedData',         c_uint32),
+        ('SizeOfUninitializedData',       c_uint32),
+        ('AddressOfEntryPoint',           c_uint32),
+        ('BaseOfCode',                    c_uint32),
+        ('ImageBase',                     c_uint64),
+        ('SectionAlignment',              c_uint32),
+        ('FileAlignment',                 c_uint32),
+        ('MajorOperatingSystemVersion',   c_uint16),
+        ('MinorOperatingSystemVersion',   c_uint16),
+        ('MajorImageVersion',             c_uint16),
+        ('MinorImageVersion',             c_uint16),
+        ('MajorSubsystemVersion',         c_uint16),
+        ('MinorSubsystemVersion',         c_uint16),
+        ('Win32VersionValue',             c_uint32),
+        ('SizeOfImage',                   c_uint32),
+        ('SizeOfHeaders',                 c_uint32),
+        ('CheckSum'     ,                 c_uint32),
+        ('Subsystem',                     c_uint16),
+        ('DllCharacteristics',            c_uint16),
+        ('SizeOfStackReserve',            c_uint64),
+        ('SizeOfStackCommit' ,            c_uint64),
+        ('SizeOfHeapReserve',             c_uint64),
+        ('SizeOfHeapCommit' ,             c_uint64),
+        ('LoaderFlags'     ,              c_uint32),
+        ('NumberOfRvaAndSizes',           c_uint32),
+        ('DataDirectory',                 ARRAY(EFI_IMAGE_DATA_DIRECTORY, 16))
+        ]
+
+class EFI_IMAGE_NT_HEADERS32(Structure):
+    _fields_ = [
+        ('Signature',            c_uint32),
+        ('FileHeader',           EFI_IMAGE_FILE_HEADER),
+        ('OptionalHeader',       EFI_IMAGE_OPTIONAL_HEADER32)
+        ]
+
+class EFI_IMAGE_NT_HEADERS64(Structure):
+    _fields_ = [
+        ('Signature',            c_uint32),
+        ('FileHeader',           EFI_IMAGE_FILE_HEADER),
+        ('OptionalHeader',       EFI_IMAGE_OPTIONAL_HEADER64)
+        ]
+
+class EFI_IMAGE_SECTION_HEADER(Structure):
+    _fields_ = [
+        ('Name',                  ARRAY(c_uint8, 8)),
+        ('VirtualSize',           c_uint32),
+        ('VirtualAddress',        c_uint32),
+        ('SizeOfRawData',         c_uint32),
+        ('PointerToRawData',      c_uint32),
+        ('PointerToRelocations',  c_uint32),
+        ('PointerToLinenumbers',  c_uint32),
+        ('NumberOfRelocations',   c_uint16),
+        ('NumberOfLinenumbers',   c_uint16),
+        ('Characteristics',       c_uint32),
+        ]
+
+class EFI_TE_IMAGE_HEADER(Structure):
+    _fields_ = [
+        ('Signature',            ARRAY(c_char, 2)),
+        ('Machine',              c_uint16),
+        ('NumberOfSections',     c_uint8),
+        ('Subsystem',            c_uint8),
+        ('StrippedSize',         c_uint16),
+        ('AddressOfEntryPoint',  c_uint32),
+        ('BaseOfCode',           c_uint32),
+        ('ImageBase',            c_uint64),
+        ('DataDirectoryBaseReloc',  EFI_IMAGE_DATA_DIRECTORY),
+        ('DataDirectoryDebug',      EFI_IMAGE_DATA_DIRECTORY)
+        ]
+
+class EFI_IMAGE_DIRECTORY_ENTRY:
+    EXPORT                     = 0
+    IMPORT                     = 1
+    RESOURCE                   = 2
+    EXCEPTION                  = 3
+    SECURITY                   = 4
+    BASERELOC                  = 5
+    DEBUG                      = 6
+    COPYRIGHT                  = 7
+    GLOBALPTR                  = 8
+    TLS                        = 9
+    LOAD_CONFIG                = 10
+
+class PE_RELOC_BLOCK_HEADER(Structure):
+    _fields_ = [
+        ('PageRVA',              c_uint32),
+        ('BlockSize',            c_uint32)
+        ]
+
+def AlignPtr (offset, alignment = 8):
+    return (offset + alignment - 1) & ~(alignment - 1)
+
+def Bytes2Val (bytes):
+    return reduce(lambda x,y: (x<<8)|y,  bytes[::-1] )
+
+def Val2Bytes (value, blen):
+    return [(value>>(i*8) & 0xff) for i in range(blen)]
+
+EFI_IMAGE_NT_OPTIONAL_HDR32_MAGIC = 0x10b
+EFI_IMAGE_NT_OPTIONAL_HDR64_MAGIC = 0x20b
+
+IMAGE_REL_BASED_ABSOLUTE          = 0
+IMAGE_REL_BASED_HIGHLOW           = 3
+IMAGE_REL_BASED_DIR64             = 10
+
+#
+# Relocation type -> (numpy dtype, struct) of the patched field
+#
+RelocFieldFormat = {
+    IMAGE_REL_BASED_HIGHLOW : ('<u4', struct.Struct('<I')),
+    IMAGE_REL_BASED_DIR64   : ('<u8', struct.Struct('<Q')),
+    }
+
+#
+# Decode the type/offset entries of one relocation block. The fixup offsets
+# are collected per relocation type in relocOffsets.
+#
+def ParseRelocBlock (data, offset, rnum, base, relocOffsets):
+    if numpy is not None:
+        entries = numpy.frombuffer(data, '<u2', rnum, offset)
+        rtypes  = entries >> 12
+        roffs   = (entries & 0xfff).astype(numpy.int64) + base
+        for rtype in numpy.unique(rtypes).tolist():
+            if rtype == IMAGE_REL_BASED_ABSOLUTE:
+                continue
+            if rtype not in RelocFieldFormat:
+                raise Exception("ERROR: Unsupported relocation type %d!" % rtype)
+            relocOffsets.setdefault(rtype, []).append(roffs[rtypes == rtype])
+    else:
+        for each in struct.unpack_from('<%dH' % rnum, data, offset):
+            rtype = each >> 12
+            if rtype == IMAGE_REL_BASED_ABSOLUTE:
+                continue
+            if rtype not in RelocFieldFormat:
+                raise Exception("ERROR: Unsupported relocation type %d!" % rtype)
+            relocOffsets.setdefault(rtype, []).append(base + (each & 0xfff))
+
+#
+# Add delta to every field of the given relocation type at base + offsets
+# in fdbin. With numpy all the fields are gathered, adjusted and scattered
+# back in one operation, otherwise they are patched one by one with a
+# precompiled struct.
+#
+def ApplyRelocations (fdbin, base, offsets, rtype, delta):
+    (dtype, field) = RelocFieldFormat[rtype]
+    mask = (1 << (field.size * 8)) - 1
+    if len(offsets) == 0:
+        return 0
+    if numpy is not None:
+        fdview = numpy.frombuffer(fdbin, numpy.uint8)
+        index  = (numpy.asarray(offsets, numpy.int64) + base)[:, None] + numpy.arange(field.size)
+        value  = fdview[index].view(dtype)
+        value += numpy.array(delta & mask, dtype)
+        fdview[index] = value.view(numpy.uint8)
+    else:
+        for offset in offsets:
+            offset += base
+            field.pack_into(fdbin, offset, (field.unpack_from(fdbin, offset)[0] + delta) & mask)
+    return len(offsets)
+
+#
+# Save the fields of the (base, offsets, rtype) fixups of fixupList as
+# (base, offsets, rtype, values), so a failed rebase can put them back
+# without keeping a copy of the whole FV
+#
+def SaveFixupFields (fdbin, fixupList):
+    savedList = []
+    for (base, offsets, rtype) in fixupList:
+        (dtype, field) = RelocFieldFormat[rtype]
+        if numpy is not None:
+            fdview = numpy.frombuffer(fdbin, numpy.uint8)
+            index  = (numpy.asarray(offsets, numpy.int64) + base)[:, None] + numpy.arange(field.size)
+            values = fdview[index].view(dtype).copy()
+        else:
+            values = [field.unpack_from(fdbin, base + offset)[0] for offset in offsets]
+        savedList.append((base, offsets, rtype, values))
+    return savedList
+
+def RestoreFixupFields (fdbin, savedList):
+    for (base, offsets, rtype, values) in savedList:
+        (dtype, field) = RelocFieldFormat[rtype]
+        if numpy is not None:
+            fdview = numpy.frombuffer(fdbin, numpy.uint8)
+            index  = (numpy.asarray(offsets, numpy.int64) + base)[:, None] + numpy.arange(field.size)
+            fdview[index] = values.view(numpy.uint8)
+        else:
+            for (offset, value) in zip(offsets, values):
+                field.pack_into(fdbin, base + offset, value)
+
+#
+# Digest of all the bytes of fdbin outside of the fixup fields, to check a
+# rebase changed nothing else. The bytes are hashed in place.
+#
+def GetUnfixedDigest (fdbin, fixupList):
+    rangeList = []
+    for (base, offsets, rtype) in fixupList:
+        size = RelocFieldFormat[rtype][1].size
+        rangeList.extend([(base + offset, base + offset + size) for offset in offsets])
+    rangeList.sort()
+
+    digest = hashlib.md5()
+    start  = 0
+    for (offset, end) in rangeList:
+        if offset > start:
+            digest.update(buffer(fdbin, start, offset - start))
+        start = max(start, end)
+    digest.update(buffer(fdbin, start))
+    return digest.digest()
+
+#
+# Count the fields of savedList, as returned by SaveFixupFields before the
+# rebase, which fdbin does not hold rebased by exactly delta
+#
+def VerifyRelocations (fdbin, savedList, delta):
+    badFields = 0
+    for (base, offsets, rtype, values) in savedList:
+        (dtype, field) = RelocFieldFormat[rtype]
+        mask = (1 << (field.size * 8)) - 1
+        if numpy is not None:
+            fdview = numpy.frombuffer(fdbin, numpy.uint8)
+            index  = (numpy.asarray(offsets, numpy.int64) + base)[:, None] + numpy.arange(field.size)
+            expect = values + numpy.array(delta & mask, dtype)
+            badFields += int(numpy.count_nonzero(fdview[index].view(dtype) != expect))
+        else:
+            for (offset, value) in zip(offsets, values):
+                if field.unpack_from(fdbin, base + offset)[0] != (value + delta) & mask:
+                    badFields += 1
+    return badFields
+
+#
+# data is either a copy of the image, or with inPlace the whole buffer the
+# image lives in at offset, e.g. a memory mapped FV file. In the latter case
+# the headers are parsed directly from that buffer without copying the image.
+#
+class PeTeImage:
+    def __init__(self, offset, data, inPlace = False):
+        self.Offset    = offset
+        if inPlace:
+            self.DataOffset = offset
+        else:
+            self.DataOffset = 0
+        tehdr          = EFI_TE_IMAGE_HEADER.from_buffer (data, self.DataOffset)
+        if   tehdr.Signature == 'VZ': # TE image
+            self.TeHdr   = tehdr
+        elif tehdr.Signature == 'MZ': # PE32 image
+            self.TeHdr   = None
+            self.DosHdr  = EFI_IMAGE_DOS_HEADER.from_buffer (data, self.DataOffset)
+            self.PeHdr   = EFI_IMAGE_NT_HEADERS32.from_buffer (data, self.DataOffset + self.DosHdr.e_lfanew)
+            if self.PeHdr.Signature != 0x4550:
+                raise Exception("ERROR: Invalid PE32 header !")
+            if self.PeHdr.OptionalHeader.Magic == EFI_IMAGE_NT_OPTIONAL_HDR64_MAGIC: # PE32+ image
+                self.PeHdr = EFI_IMAGE_NT_HEADERS64.from_buffer (data, self.DataOffset + self.DosHdr.e_lfanew)
+            if self.PeHdr.FileHeader.SizeOfOptionalHeader < type(self.PeHdr.OptionalHeader).DataDirectory.offset:
+                raise Exception("ERROR: Unsupported PE32 image !")
+            if self.PeHdr.OptionalHeader.NumberOfRvaAndSizes <= EFI_IMAGE_DIRECTORY_ENTRY.BASERELOC:
+                raise Exception("ERROR: No relocation information available !")
+        self.Offset    = offset
+        self.Data      = data
+        self.RelocList = {}
+
+    def IsTeImage(self):
+        return  self.TeHdr is not None
+
+    def ParseReloc(self):
+        if self.IsTeImage():
+            rsize   = self.TeHdr.DataDirectoryBaseReloc.Size
+            roffset = sizeof(self.TeHdr) - self.TeHdr.StrippedSize + self.TeHdr.DataDirectoryBaseReloc.VirtualAddress
+            adjust  = sizeof(self.TeHdr) - self.TeHdr.StrippedSize
+        else:
+            rsize   = self.PeHdr.OptionalHeader.DataDirectory[EFI_IMAGE_DIRECTORY_ENTRY.BASERELOC].Size
+            roffset = self.PeHdr.OptionalHeader.DataDirectory[EFI_IMAGE_DIRECTORY_ENTRY.BASERELOC].VirtualAddress
+            adjust  = 0
+
+        relocOffsets = {}
+        roffset += self.DataOffset
+        offset = roffset
+        while offset < roffset + rsize:
+            # the blocks are aligned relative to the start of the image
+            offset = AlignPtr(offset - self.DataOffset, 4) + self.DataOffset
+            blkhdr = PE_RELOC_BLOCK_HEADER.from_buffer(self.Data, offset)
+            offset += sizeof(blkhdr)
+            # Read relocation type,offset pairs
+            rlen  = blkhdr.BlockSize - sizeof(PE_RELOC_BLOCK_HEADER)
+            rnum  = rlen // sizeof(c_uint16)
+            ParseRelocBlock (self.Data, offset, rnum, blkhdr.PageRVA + adjust, relocOffsets)
+            offset += rnum * sizeof(c_uint16)
+
+        # RelocList maps each relocation type to the offsets of its fixups
+        for rtype in relocOffsets:
+            if numpy is not None:
+                self.RelocList[rtype] = numpy.concatenate(relocOffsets[rtype])
+            else:
+                self.RelocList[rtype] = relocOffsets[rtype]
+
+    #
+    # Offset and relocation type of the ImageBase field of the image header
+    #
+    def GetImageBaseField(self):
+        if self.IsTeImage():
+            offset  = self.Offset + EFI_TE_IMAGE_HEADER.ImageBase.offset
+            size    = EFI_TE_IMAGE_HEADER.ImageBase.size
+        else:
+            offset  = self.Offset + self.DosHdr.e_lfanew
+            offset += type(self.PeHdr).OptionalHeader.offset
+            offset += type(self.PeHdr.OptionalHeader).ImageBase.offset
+            size    = type(self.PeHdr.OptionalHeader).ImageBase.size
+        if size == sizeof(c_uint64):
+            return (offset, IMAGE_REL_BASED_DIR64)
+        return (offset, IMAGE_REL_BASED_HIGHLOW)
+
+    #
+    # (base, offsets, rtype) list of all the fields Rebase adjusts
+    #
+    def GetFixupList(self):
+        fixupList = []
+        for rtype in self.RelocList:
+            fixupList.append((self.Offset, self.RelocList[rtype], rtype))
+        (offset, rtype) = self.GetImageBaseField()
+        fixupList.append((offset, [0], rtype))
+        return fixupList
+
+    def Rebase(self, delta, fdbin):
+        count = 0
+        if delta == 0:
+            return count
+
+        for rtype in self.RelocList:
+            count += ApplyRelocations (fdbin, self.Offset, self.RelocList[rtype], rtype, delta)
+
+        # fdbin may be a memory mapped file, so patch it through struct
+        # rather than through slices
+        (offset, rtype) = self.GetImageBaseField()
+        field  = RelocFieldFormat[rtype][1]
+        value  = field.unpack_from(fdbin, offset)[0] + delta
+        field.pack_into(fdbin, offset, value & ((1 << (field.size * 8)) - 1))
+
+        return count
+
+
+def GetSize3 (size):
+    return size[0] + (size[1] << 8) + (size[2] << 16)
+
+def GuidToString (guid):
+    return "%08X-%04X-%04X-%02X%02X-%02X%02X%02X%02X%02X%02X" % (guid.Guid1, guid.Guid2, guid.Guid3, guid.Guid4[0], guid.Guid4[1], guid.Guid4[2], guid.Guid4[3], guid.Guid4[4], guid.Guid4[5], guid.Guid4[6], guid.Guid4[7])
+
+#
+# The classes below describe a firmware volume held in data, which may be a
+# bytearray or a memory mapped file. Headers are parsed in place with
+# from_buffer at their offset in data, nothing is copied, and the FFS file
+# and section lists are only parsed when they are first asked for.
+#
+class Section:
+    def __init__(self, data, offset):
+        self.Data     = data
+        self.Offset   = offset
+        self.SecHdr   = EFI_COMMON_SECTION_HEADER.from_buffer (data, offset)
+        self.Size     = GetSize3 (self.SecHdr.Size)
+        self.IsLarge  = (self.Size == 0xFFFFFF)
+        if self.IsLarge:
+            self.SecHdr = EFI_COMMON_SECTION_HEADER2.from_buffer (data, offset)
+            self.Size   = int(self.SecHdr.ExtendedSize)
+        self.Type     = self.SecHdr.Type
+        self.DataOffset = offset + sizeof(self.SecHdr)
+        self.SecList  = None
+
+        #
+        # Only the encapsulation sections whose content can be read in
+        # place hold child sections: uncompressed compression sections and
+        # GUID defined sections that need no processing.
+        #
+        self.IsEncapsulation = False
+        if self.Type == EFI_SECTION_COMPRESSION:
+            if self.IsLarge:
+                comphdr = EFI_COMPRESSION_SECTION2.from_buffer (data, offset)
+            else:
+                comphdr = EFI_COMPRESSION_SECTION.from_buffer (data, offset)
+            self.DataOffset = offset + sizeof(comphdr)
+            self.IsEncapsulation = (comphdr.CompressionType == EFI_NOT_COMPRESSED)
+        elif self.Type == EFI_SECTION_GUID_DEFINED:
+            if self.IsLarge:
+                guidhdr = EFI_GUID_DEFINED_SECTION2.from_buffer (data, offset)
+            else:
+                guidhdr = EFI_GUID_DEFINED_SECTION.from_buffer (data, offset)
+            self.DataOffset = offset + guidhdr.DataOffset
+            self.IsEncapsulation = (guidhdr.Attributes & EFI_GUIDED_SECTION_PROCESSING_REQUIRED) == 0
+        elif self.Type == EFI_SECTION_DISPOSABLE:
+            self.IsEncapsulation = True
+
+    def IsImage(self):
+        return self.Type in [EFI_SECTION_PE32, EFI_SECTION_TE]
+
+    def GetSectionList(self):
+        if self.SecList is None:
+            if self.IsEncapsulation:
+                self.SecList = ParseSectionList (self.Data, self.DataOffset, self.Offset + self.Size)
+            else:
+                self.SecList = []
+        return self.SecList
+
+    def GetFirmwareVolume(self):
+        if self.Type != EFI_SECTION_FIRMWARE_VOLUME_IMAGE:
+            return None
+        return FirmwareVolume (self.Data, self.DataOffset)
+
+#
+# The sections are aligned relative to the start of the section stream
+#
+def ParseSectionList (data, offset, end):
+    secList = []
+    start   = offset
+    while offset + sizeof(EFI_COMMON_SECTION_HEADER) <= end:
+        sec = Section (data, offset)
+        if sec.Size < sizeof(EFI_COMMON_SECTION_HEADER):
+            raise Exception("ERROR: Invalid section size at 0x%X !" % offset)
+        secList.append(sec)
+        offset = start + AlignPtr(offset + sec.Size - start, 4)
+    return secList
+
+#
+# Walk the section tree of secList, descending into encapsulation sections
+#
+def IterSections (secList):
+    for sec in secList:
+        yield sec
+        if sec.IsEncapsulation:
+            for child in IterSections (sec.GetSectionList()):
+                yield child
+
+class FirmwareFile:
+    def __init__(self, data, offset):
+        self.Data     = data
+        self.Offset   = offset
+        self.FfsHdr   = EFI_FFS_FILE_HEADER.from_buffer (data, offset)
+        self.Size     = GetSize3 (self.FfsHdr.Size)
+        if self.FfsHdr.Attributes & FFS_ATTRIB_LARGE_FILE:
+            self.FfsHdr = EFI_FFS_FILE_HEADER2.from_buffer (data, offset)
+            self.Size   = int(self.FfsHdr.ExtendedSize)
+        self.Name     = GuidToString (self.FfsHdr.Name)
+        self.Type     = self.FfsHdr.Type
+        self.DataOffset = offset + sizeof(self.FfsHdr)
+        self.SecList  = None
+
+    def IsPad(self):
+        return self.Type in [0xFF, EFI_FV_FILETYPE_FFS_PAD]
+
+    def GetSectionList(self):
+        if self.SecList is None:
+            if self.IsPad() or (self.Type == EFI_FV_FILETYPE_RAW):
+                self.SecList = []
+            else:
+                self.SecList = ParseSectionList (self.Data, self.DataOffset, self.Offset + self.Size)
+        return self.SecList
+
+    def IterSections(self):
+        return IterSections (self.GetSectionList())
+
+    #
+    # Only the top level image sections are looked up, the images inside
+    # encapsulation sections may be covered by a checksum of the
+    # encapsulation section, e.g. a CRC32 GUID defined section, so they
+    # must not be patched in place.
+    #
+    def FindImageSection(self):
+        for sec in self.GetSectionList():
+            if sec.IsImage():
+                return sec
+        return None
+
+class FirmwareVolume:
+    def __init__(self, data, offset = 0):
+        self.Data     = data
+        self.Offset   = offset
+        self.FvHdr    = EFI_FIRMWARE_VOLUME_HEADER.from_buffer (data, offset)
+        if self.FvHdr.ExtHeaderOffset > 0:
+            self.FvExtHdr = EFI_FIRMWARE_VOLUME_EXT_HEADER.from_buffer (data, offset + self.FvHdr.ExtHeaderOffset)
+            self.Name     = GuidToString (self.FvExtHdr.FvName)
+        else:
+            self.FvExtHdr = None
+            self.Name     = ""
+        self.FfsList  = None
+        self.FfsDict  = None
+
+    def GetFfsList(self):
+        if self.FfsList is not None:
+            return self.FfsList
+
+        self.FfsList = []
+        if self.FvExtHdr:
+            offset = self.FvHdr.ExtHeaderOffset + self.FvExtHdr.ExtHeaderSize
+        else:
+            offset = self.FvHdr.HeaderLength
+        offset = AlignPtr(offset)
+        while offset + sizeof(EFI_FFS_FILE_HEADER) <= self.FvHdr.FvLength:
+            ffshdr = EFI_FFS_FILE_HEADER.from_buffer (self.Data, self.Offset + offset)
+            if GetSize3 (ffshdr.Size) == 0xFFFFFF:
+                # free space
+                break
+            ffs = FirmwareFile (self.Data, self.Offset + offset)
+            if ffs.Size < sizeof(EFI_FFS_FILE_HEADER):
+                raise Exception("ERROR: Invalid FFS file size at 0x%X !" % offset)
+            self.FfsList.append(ffs)
+            offset = AlignPtr(offset + ffs.Size)
+        return self.FfsList
+
+    def GetFile(self, guid):
+        if self.FfsDict is None:
+            self.FfsDict = {}
+            for ffs in self.GetFfsList():
+                if ffs.Name not in self.FfsDict:
+                    self.FfsDict[ffs.Name] = ffs
+        return self.FfsDict.get(guid.upper())
+
+    def IterImageSections(self):
+        for ffs in self.GetFfsList():
+            for sec in ffs.GetSectionList():
+                if sec.IsImage():
+                    yield (ffs, sec)
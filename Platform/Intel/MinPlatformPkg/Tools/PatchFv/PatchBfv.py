@@ -8,35 +8,32 @@
 import os
 import re
 import sys
+import json
 import time
 import shutil
 import struct
 import binascii
 from   ctypes import *
+from   ReportLib import *
 
 class FileChecker:
     def __init__(self):
         self.fdName = ""
         self.reportFile = ""
+        self.dryRun = False
         self.pcd = ["", "", ""]
 
     def PrintPcd(self):
         print "PCD: " + self.pcd[0] + "|" + self.pcd[1] + "(" + self.pcd[2] + ")"
 
     def ProcessReport(self):
-        try :
-            file = open(self.reportFile)
-        except Exception:
-            print "fail to open " + self.reportFile
+        report = LoadBuildReport (self.reportFile)
+        if report is None:
             return
-        try:
-            file.seek(0)
-            print "checking - " + self.pcd[0]
-            ValuePair = self.GetPcdFromReport (file, self.pcd[0])
-            self.pcd[1] = ValuePair[0]
-            self.pcd[2] = ValuePair[1]
-        finally:
-            file.close()
+        print "checking - " + self.pcd[0]
+        ValuePair = report.GetPcd (self.pcd[0])
+        self.pcd[1] = ValuePair[0]
+        self.pcd[2] = ValuePair[1]
 
         self.PrintPcd()
 
@@ -45,73 +42,64 @@ class FileChecker:
         print "patching BFV - " + fileName
 
         try :
-            file = open(fileName, "rb")
+            file = open(fileName, "rb" if self.dryRun else "r+b")
         except Exception:
             print "fail to open " + fileName
             return
         try:
-            buffer = file.read()
-            data = bytearray(buffer)
-            file.close()
-
             offset = -4
 
-            l = struct.pack("L", int(self.pcd[1],16))
-            print "  [" + hex(offset) + "] " + binascii.hexlify(data[-4:]) + " <= " + binascii.hexlify(l)
-            data[-4:] = l
-
-            file = open(fileName, "wb")
-            file.write(data[0:])
+            #
+            # Only the last 4 bytes of the FD are read and written
+            #
+            file.seek(offset, os.SEEK_END)
+            fieldOffset = file.tell()
+            old = file.read(4)
+
+            l = struct.pack("<I", int(self.pcd[1],16))
+            print "  [" + hex(offset) + "] " + binascii.hexlify(old) + " <= " + binascii.hexlify(l)
+            Changed = (old != l)
+
+            if self.dryRun:
+                print "dry run - " + fileName + " is not written"
+            elif not Changed:
+                print "up to date - " + fileName + " is not written"
+            else:
+                file.seek(fieldOffset)
+                file.write(l)
         finally:
             file.close()
 
-    def GetPcdFromReport(self, file, pcd):
-        FoundPkg = False
-        pcdSplit = pcd.split(".")
-        TargetPkg = pcdSplit[0]
-        TargetPcd = pcdSplit[1]
-        while 1:
-            line = file.readline()
-            if not line:
-                break
-
-            newline = line[:-1]
-
-            if (cmp (newline, TargetPkg) == 0):
-                FoundPkg = True
-                continue
-
-            if (cmp (newline, "") == 0) or ((cmp (newline[0], " ") != 0) and (cmp (newline[0], "0") != 0)):
-                FoundPkg = False
-
-            if (FoundPkg == True) :
-                newline = newline.strip()
-                splitLine = newline.split(" ", 2)
-                if (cmp (splitLine[0], "*F") == 0) or (cmp (splitLine[0], "*P") == 0) :
-                    if (cmp (splitLine[1], TargetPcd) == 0):
-                        print "found - " + TargetPkg + "." + TargetPcd
-
-                        splitLine = splitLine[2].strip()[1:].strip().split(" ", 1)
-                        if (cmp (splitLine[0], "FIXED") == 0) or (cmp (splitLine[0], "PATCH") == 0):
-                            SplitLine = splitLine[1].strip()[1:].split(")", 1)
-                            Type = SplitLine[0]
-                            Value = SplitLine[1].strip()[1:].strip().split()[0]
-                            print "  Type - (" + Type + "), Value - (" + Value + ")"
-                            return [Value, Type]
-        return ["", ""]
-            
+        self.WritePatchDiff(fileName + ".PatchPcd.json", fileName, [{
+            "Pcd"     : self.pcd[0],
+            "Type"    : self.pcd[2],
+            "Offset"  : hex(fieldOffset),
+            "Old"     : binascii.hexlify(old),
+            "New"     : binascii.hexlify(l),
+            "Changed" : Changed
+            }], Changed)
+
+    def WritePatchDiff(self, fileName, fdFileName, DiffList, Changed):
+        try:
+            with open(fileName, "w") as file:
+                json.dump({"Fd" : fdFileName, "DryRun" : self.dryRun, "Changed" : Changed, "Patches" : DiffList}, file, indent = 2)
+        except EnvironmentError:
+            print "fail to write " + fileName
+
 def main():
     global FileChecker
 
     fileChecker = FileChecker()
 
-    if (len(sys.argv) != 4) :
-        print "usage: PatchBfv <FdFile> <ReportFile> <BfvPcdName>"
+    argList = [arg for arg in sys.argv[1:] if arg != "--dry-run"]
+    if (len(argList) != 3) :
+        print "usage: PatchBfv [--dry-run] <FdFile> <ReportFile> <BfvPcdName>"
         return 0
 
-    fileChecker.fdName = sys.argv[1]
-    fileChecker.reportFile = sys.argv[2]
-    fileChecker.pcd[0] = sys.argv[3]
+    fileChecker.dryRun = (len(argList) != len(sys.argv) - 1)
+    fileChecker.fdName = argList[0]
+    fileChecker.reportFile = argList[1]
+    fileChecker.pcd[0] = argList[2]
 
     fileChecker.ProcessReport ()
     fileChecker.PatchFd ()
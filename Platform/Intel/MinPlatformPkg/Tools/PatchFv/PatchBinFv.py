@@ -10,9 +10,62 @@ import re
 import sys
 import time
 import shutil
+import json
 import struct
 import binascii
 from   ctypes import *
+from   ReportLib import *
+
+#
+# Datum type -> precompiled struct of the scalar PCD types
+#
+PcdFieldFormat = {
+    "BOOLEAN" : struct.Struct("<B"),
+    "UINT8"   : struct.Struct("<B"),
+    "UINT16"  : struct.Struct("<H"),
+    "UINT32"  : struct.Struct("<I"),
+    "UINT64"  : struct.Struct("<Q"),
+    }
+
+PCD_ARRAY_TYPE = "VOID*"
+
+#
+# Convert a VOID* PCD value, {0x01, 0x02}, "String" or L"String", to bytes
+#
+def PcdArrayToBytes (value):
+    value = value.strip()
+    if value.startswith("{") and value.endswith("}"):
+        items = [item.strip() for item in value[1:-1].split(",")]
+        return bytearray([int(item, 16) & 0xFF for item in items if item != ""])
+    if value.startswith("L\"") and value.endswith("\""):
+        return bytearray((value[2:-1] + "\0").encode("utf-16-le"))
+    if value.startswith("\"") and value.endswith("\""):
+        return bytearray(value[1:-1] + "\0")
+    raise ValueError("unsupported VOID* value " + value)
+
+#
+# Convert a PCD value to the (struct, value) pair packed into the binary,
+# maxSize is the size of the VOID* buffer, the "%ds" struct pads the value
+# with zeros up to this size
+#
+def PcdValueToField (pcdType, value, maxSize = None):
+    if pcdType == PCD_ARRAY_TYPE:
+        data = PcdArrayToBytes (value)
+        if maxSize is None:
+            maxSize = len(data)
+        if len(data) > maxSize:
+            raise ValueError("value is larger than the %d bytes buffer" % maxSize)
+        return (struct.Struct("%ds" % maxSize), bytes(data))
+    field = PcdFieldFormat[pcdType]
+    if value.upper() == "TRUE":
+        number = 1
+    elif value.upper() == "FALSE":
+        number = 0
+    else:
+        number = int(value, 16)
+    if (number < 0) or (number >= (1 << (field.size * 8))):
+        raise ValueError("value does not fit in " + pcdType)
+    return (field, number)
 
 class FileChecker:
     def __init__(self):
@@ -21,6 +74,7 @@ class FileChecker:
         self.target = ""
         self.sourceRoot = ""
         self.reportFile = ""
+        self.dryRun = False
         self.InfPcdList = []
 
     def GetSectionName(self, line):
@@ -95,12 +149,11 @@ class FileChecker:
                     if (cmp (line[0], "#") == 0) :
                         continue
 
-                    splitLine = line.split(" ")
-                    line = splitLine[0]
+                    # VOID* values may hold spaces, the offset is the last field
+                    splitLine = line.split("|", 1)
+                    valueOffset = splitLine[1].rsplit("|", 1)
 
-                    splitLine = line.split("|")
-
-                    self.InfPcdList.append([splitLine[0], splitLine[1], splitLine[2], "", ""])
+                    self.InfPcdList.append([splitLine[0].strip(), valueOffset[0].strip(), valueOffset[1].split()[0], "", ""])
 
         finally:
             file.close()
@@ -119,23 +172,86 @@ class FileChecker:
 
         #self.PrintPcdList(self.InfPcdList)
 
-        try :
-            file = open(self.reportFile)
-        except Exception:
-            print "fail to open " + self.reportFile
+        report = LoadBuildReport (self.reportFile)
+        if report is None:
             return
-        try:
-            for pcd in self.InfPcdList:
-                file.seek(0)
-                print "checking - " + pcd[0]
-                ValuePair = self.GetPcdFromReport (file, pcd[0])
-                pcd[3] = ValuePair[0]
-                pcd[4] = ValuePair[1]
-        finally:
-            file.close()
+        for pcd in self.InfPcdList:
+            print "checking - " + pcd[0]
+            ValuePair = report.GetPcd (pcd[0])
+            pcd[3] = ValuePair[0]
+            pcd[4] = ValuePair[1]
 
         self.PrintPcdList(self.InfPcdList)
 
+    #
+    # Compile the PCDs found in the report into a patch plan of
+    # (offset, struct, value, pcd) entries, grouped by datum type and sorted
+    # by offset. PCDs of an unsupported datum type are skipped with a warning.
+    # Returns None if a PCD cannot be patched in a dataSize bytes FV.
+    #
+    def GetPatchPlan(self, dataSize):
+        PatchPlan = []
+        for pcd in self.InfPcdList:
+            if (cmp (pcd[4], "") == 0):
+                continue
+            if (pcd[4] not in PcdFieldFormat) and (pcd[4] != PCD_ARRAY_TYPE):
+                print "WARNING: " + pcd[0] + " - unsupported type " + pcd[4] + " is not patched"
+                continue
+            try:
+                offset = int(pcd[2], 16)
+                maxSize = None
+                if pcd[4] == PCD_ARRAY_TYPE:
+                    maxSize = len(PcdArrayToBytes (pcd[1]))
+                (field, value) = PcdValueToField (pcd[4], pcd[3], maxSize)
+            except ValueError as error:
+                print "ERROR: " + pcd[0] + " - " + str(error)
+                return None
+            if (offset < 0) or (offset + field.size > dataSize):
+                print "ERROR: " + pcd[0] + " - offset " + hex(offset) + " is out of the FV"
+                return None
+            PatchPlan.append((offset, field, value, pcd))
+
+        PatchPlan.sort(key = lambda entry: (entry[3][4], entry[0]))
+
+        ranges = sorted([(offset, offset + field.size, pcd[0]) for (offset, field, value, pcd) in PatchPlan])
+        for index in range(1, len(ranges)):
+            if ranges[index][0] < ranges[index - 1][1]:
+                print "ERROR: " + ranges[index][2] + " overlaps " + ranges[index - 1][2]
+                return None
+        return PatchPlan
+
+    #
+    # Apply the patch plan to data, returns the list of changes for the diff
+    # and whether any byte of data was changed
+    #
+    def ApplyPatchPlan(self, data, PatchPlan):
+        DiffList = []
+        Changed = False
+        view = memoryview(data)
+        for (offset, field, value, pcd) in PatchPlan:
+            oldData = view[offset:offset + field.size].tobytes()
+            field.pack_into(data, offset, value)
+            newData = view[offset:offset + field.size].tobytes()
+            print "  [" + hex(offset) + "] " + binascii.hexlify(oldData) + " <= " + binascii.hexlify(newData)
+            if oldData != newData:
+                Changed = True
+            DiffList.append({
+                "Pcd"     : pcd[0],
+                "Type"    : pcd[4],
+                "Offset"  : hex(offset),
+                "Old"     : binascii.hexlify(oldData),
+                "New"     : binascii.hexlify(newData),
+                "Changed" : oldData != newData
+                })
+        return (DiffList, Changed)
+
+    def WritePatchDiff(self, fileName, fvFileName, DiffList, Changed):
+        try:
+            with open(fileName, "w") as file:
+                json.dump({"Fv" : fvFileName, "DryRun" : self.dryRun, "Changed" : Changed, "Patches" : DiffList}, file, indent = 2)
+        except EnvironmentError:
+            print "fail to write " + fileName
+
     def PatchFv(self, fvName):
         sourceFileName = os.path.join(self.sourceRoot,fvName,self.target,fvName+".Fv")
         print "patching - " + sourceFileName
@@ -144,86 +260,49 @@ class FileChecker:
             file = open(sourceFileName, "rb")
         except Exception:
             print "fail to open " + sourceFileName
-            return
+            return False
         try:
             buffer = file.read()
             data = bytearray(buffer)
             file.close()
 
-            for pcd in self.InfPcdList:
-                offset = int(pcd[2], 16)
-                if (cmp (pcd[4], "BOOLEAN") == 0) or (cmp (pcd[4], "UINT8") == 0):
-                    b = struct.pack("B", int(pcd[3],16))
-                    print "  [" + hex(offset) + "] " + binascii.hexlify(data[offset:offset+1]) + " <= " + binascii.hexlify(b)
-                    data[offset:offset+1] = b
-                elif (cmp (pcd[4], "UINT16") == 0):
-                    h = struct.pack("H", int(pcd[3],16))
-                    print "  [" + hex(offset) + "] " + binascii.hexlify(data[offset:offset+2]) + " <= " + binascii.hexlify(h)
-                    data[offset:offset+2] = h
-                elif (cmp (pcd[4], "UINT32") == 0):
-                    l = struct.pack("I", int(pcd[3],16))
-                    print "  [" + hex(offset) + "] " + binascii.hexlify(data[offset:offset+4]) + " <= " + binascii.hexlify(l)
-                    data[offset:offset+4] = l
-                elif (cmp (pcd[4], "UINT64") == 0):
-                    q = struct.pack("Q", int(pcd[3],16))
-                    print "  [" + hex(offset) + "] " + binascii.hexlify(data[offset:offset+8]) + " <= " + binascii.hexlify(q)
-                    data[offset:offset+8] = q
-            file = open(sourceFileName, "wb")
-            file.write(data)
+            PatchPlan = self.GetPatchPlan(len(data))
+            if PatchPlan is None:
+                return False
+            (DiffList, Changed) = self.ApplyPatchPlan(data, PatchPlan)
+
+            if self.dryRun:
+                print "dry run - " + sourceFileName + " is not written"
+            elif not Changed:
+                print "up to date - " + sourceFileName + " is not written"
+            else:
+                file = open(sourceFileName, "wb")
+                file.write(data)
         finally:
             file.close()
 
-    def GetPcdFromReport(self, file, pcd):
-        FoundPkg = False
-        pcdSplit = pcd.split(".")
-        TargetPkg = pcdSplit[0]
-        TargetPcd = pcdSplit[1]
-        while 1:
-            line = file.readline()
-            if not line:
-                break
-
-            newline = line[:-1]
-
-            if (cmp (newline, TargetPkg) == 0):
-                FoundPkg = True
-                continue
+        self.WritePatchDiff(os.path.join(self.sourceRoot,fvName,self.target,fvName+".PatchPcd.json"), sourceFileName, DiffList, Changed)
+        return True
 
-            if (cmp (newline, "") == 0) or ((cmp (newline[0], " ") != 0) and (cmp (newline[0], "0") != 0)):
-                FoundPkg = False
-
-            if (FoundPkg == True) :
-                newline = newline.strip()
-                splitLine = newline.split(" ", 2)
-                if (cmp (splitLine[0], "*F") == 0) or (cmp (splitLine[0], "*P") == 0):
-                    if (cmp (splitLine[1], TargetPcd) == 0):
-                        print "found - " + TargetPkg + "." + TargetPcd
-
-                        splitLine = splitLine[2].strip()[1:].strip().split(" ", 1)
-                        if (cmp (splitLine[0], "FIXED") == 0) or (cmp (splitLine[0], "PATCH") == 0):
-                            SplitLine = splitLine[1].strip()[1:].split(")", 1)
-                            Type = SplitLine[0]
-                            Value = SplitLine[1].strip()[1:].strip().split()[0]
-                            print "  Type - (" + Type + "), Value - (" + Value + ")"
-                            return [Value, Type]
-        return ["", ""]
-            
 def main():
     global FileChecker
 
     fileChecker = FileChecker()
 
-    if (len(sys.argv) != 5) :
-        print "usage: PatchBinFv <Target> <SourceRoot> <ReportFile> <FvName>"
+    argList = [arg for arg in sys.argv[1:] if arg != "--dry-run"]
+    if (len(argList) != 4) :
+        print "usage: PatchBinFv [--dry-run] <Target> <SourceRoot> <ReportFile> <FvName>"
         return 0
 
-    fileChecker.target = sys.argv[1]
-    fileChecker.sourceRoot = sys.argv[2]
-    fileChecker.reportFile = sys.argv[3]
-    fileChecker.FvName = sys.argv[4]
+    fileChecker.dryRun = (len(argList) != len(sys.argv) - 1)
+    fileChecker.target = argList[0]
+    fileChecker.sourceRoot = argList[1]
+    fileChecker.reportFile = argList[2]
+    fileChecker.FvName = argList[3]
 
     fileChecker.ProcessFvInf (fileChecker.FvName)
-    fileChecker.PatchFv (fileChecker.FvName)
+    if not fileChecker.PatchFv (fileChecker.FvName):
+        return 1
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,133 @@
+## @ ReportLib.py
+#
+# Build report PCD index shared by the PatchFv tools.
+#
+# Copyright (c) 2017 - 2019, Intel Corporation. All rights reserved.<BR>
+# SPDX-License-Identifier: BSD-2-Clause-Patent
+#
+
+import os
+import json
+
+#
+# The index of a report is saved next to it, and reused as long as the size
+# and the modification time of the report do not change
+#
+REPORT_INDEX_SUFFIX  = ".PcdIndex.json"
+REPORT_INDEX_VERSION = 1
+
+class BuildReport:
+    def __init__(self, reportFile):
+        self.ReportFile = reportFile
+        # TokenSpace.PcdName -> (Type, Value, Kind)
+        self.PcdDict    = {}
+
+    #
+    # Index the FIXED and PATCH PCDs overridden by the platform (*P) or the
+    # FDF (*F) in one pass over the report. The first value found for a PCD
+    # is kept.
+    #
+    def Parse(self, file):
+        TokenSpace = None
+        PendingPcd = None
+        for line in file:
+            newline = line.rstrip("\r\n")
+
+            if (newline == "") or ((newline[0] != " ") and (newline[0] != "0")):
+                TokenSpace = newline or None
+                PendingPcd = None
+                continue
+
+            if TokenSpace is None:
+                continue
+
+            newline = newline.strip()
+
+            # VOID* arrays may continue over several lines
+            if PendingPcd is not None:
+                (Type, Value, Kind) = self.PcdDict[PendingPcd]
+                Value = Value + " " + newline
+                self.PcdDict[PendingPcd] = (Type, Value, Kind)
+                if "}" in newline:
+                    PendingPcd = None
+                continue
+
+            splitLine = newline.split(" ", 2)
+            if (len(splitLine) < 3) or (splitLine[0] not in ["*F", "*P"]):
+                continue
+            PcdName = TokenSpace + "." + splitLine[1]
+            if PcdName in self.PcdDict:
+                continue
+
+            splitLine = splitLine[2].strip()[1:].strip().split(" ", 1)
+            if (len(splitLine) < 2) or (splitLine[0] not in ["FIXED", "PATCH"]):
+                continue
+            Kind = splitLine[0]
+            SplitLine = splitLine[1].strip()[1:].split(")", 1)
+            Type  = SplitLine[0]
+            Value = SplitLine[1].strip()[1:].strip()
+            if Value.startswith("{"):
+                if "}" not in Value:
+                    PendingPcd = PcdName
+            elif Value != "":
+                Value = Value.split()[0]
+            self.PcdDict[PcdName] = (Type, Value, Kind)
+
+    def Load(self, useIndex = True):
+        stat = os.stat(self.ReportFile)
+        indexFile = self.ReportFile + REPORT_INDEX_SUFFIX
+        if useIndex and os.path.exists(indexFile):
+            try:
+                with open(indexFile) as file:
+                    index = json.load(file)
+                if (index["Version"] == REPORT_INDEX_VERSION) and (index["Size"] == stat.st_size) and (index["MTime"] == stat.st_mtime):
+                    for PcdName in index["PcdDict"]:
+                        self.PcdDict[str(PcdName)] = tuple([str(item) for item in index["PcdDict"][PcdName]])
+                    return
+            except (EnvironmentError, ValueError, KeyError, TypeError):
+                self.PcdDict = {}
+
+        with open(self.ReportFile) as file:
+            self.Parse(file)
+
+        if useIndex:
+            index = {
+                "Version" : REPORT_INDEX_VERSION,
+                "Size"    : stat.st_size,
+                "MTime"   : stat.st_mtime,
+                "PcdDict" : self.PcdDict
+                }
+            try:
+                with open(indexFile, "w") as file:
+                    json.dump(index, file)
+            except EnvironmentError:
+                pass
+
+    #
+    # Return [Value, Type] of the PCD, or ["", ""] if it is not found
+    #
+    def GetPcd(self, pcd):
+        if pcd not in self.PcdDict:
+            return ["", ""]
+        (Type, Value, Kind) = self.PcdDict[pcd]
+        print "found - " + pcd
+        print "  Type - (" + Type + "), Value - (" + Value + ")"
+        return [Value, Type]
+
+BuildReportCache = {}
+
+#
+# Return the BuildReport of reportFile, parsing it at most once per process.
+# Returns None if the report cannot be read.
+#
+def LoadBuildReport (reportFile):
+    reportFile = os.path.abspath(reportFile)
+    if reportFile not in BuildReportCache:
+        report = BuildReport (reportFile)
+        try:
+            report.Load ()
+        except EnvironmentError:
+            print "fail to open " + report.ReportFile
+            return None
+        BuildReportCache[reportFile] = report
+    return BuildReportCache[reportFile]
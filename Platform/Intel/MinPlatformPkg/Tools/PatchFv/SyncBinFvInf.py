@@ -8,140 +8,22 @@
 import os
 import re
 import sys
+import json
 import time
+import mmap
 import shutil
 from   ctypes import *
-
-class GUID(Structure):
-    _fields_ = [
-        ('Guid1',            c_uint32),
-        ('Guid2',            c_uint16),
-        ('Guid3',            c_uint16),
-        ('Guid4',            ARRAY(c_uint8, 8)),
-        ]
-
-
-class EFI_FIRMWARE_VOLUME_HEADER(Structure):
-    _fields_ = [
-        ('ZeroVector',           ARRAY(c_uint8, 16)),
-        ('FileSystemGuid',       GUID),
-        ('FvLength',             c_uint64),
-        ('Signature',            c_uint32),
-        ('Attributes',           c_uint32),
-        ('HeaderLength',         c_uint16),
-        ('Checksum',             c_uint16),
-        ('ExtHeaderOffset',      c_uint16),
-        ('Reserved',             c_uint8),
-        ('Revision',             c_uint8),
-        ]
-
-#
-# File Types Definitions
-#
-EFI_FV_FILETYPE_ALL                   = 0x00
-EFI_FV_FILETYPE_RAW                   = 0x01
-EFI_FV_FILETYPE_FREEFORM              = 0x02
-EFI_FV_FILETYPE_SECURITY_CORE         = 0x03
-EFI_FV_FILETYPE_PEI_CORE              = 0x04
-EFI_FV_FILETYPE_DXE_CORE              = 0x05
-EFI_FV_FILETYPE_PEIM                  = 0x06
-EFI_FV_FILETYPE_DRIVER                = 0x07
-EFI_FV_FILETYPE_COMBINED_PEIM_DRIVER  = 0x08
-EFI_FV_FILETYPE_APPLICATION           = 0x09
-EFI_FV_FILETYPE_SMM                   = 0x0A
-EFI_FV_FILETYPE_FIRMWARE_VOLUME_IMAGE = 0x0B
-EFI_FV_FILETYPE_COMBINED_SMM_DXE      = 0x0C
-EFI_FV_FILETYPE_SMM_CORE              = 0x0D
-EFI_FV_FILETYPE_OEM_MIN               = 0xc0
-EFI_FV_FILETYPE_OEM_MAX               = 0xdf
-EFI_FV_FILETYPE_DEBUG_MIN             = 0xe0
-EFI_FV_FILETYPE_DEBUG_MAX             = 0xef
-EFI_FV_FILETYPE_FFS_MIN               = 0xf0
-EFI_FV_FILETYPE_FFS_MAX               = 0xff
-EFI_FV_FILETYPE_FFS_PAD               = 0xf0
-#
-# FFS File Attributes.
-#
-FFS_ATTRIB_LARGE_FILE         = 0x01
-FFS_ATTRIB_DATA_ALIGNMENT_2   = 0x02
-FFS_ATTRIB_FIXED              = 0x04
-FFS_ATTRIB_DATA_ALIGNMENT     = 0x38
-FFS_ATTRIB_CHECKSUM           = 0x40
-
-#
-# FFS File State Bits.
-#
-EFI_FILE_HEADER_CONSTRUCTION  = 0x01
-EFI_FILE_HEADER_VALID         = 0x02
-EFI_FILE_DATA_VALID           = 0x04
-EFI_FILE_MARKED_FOR_UPDATE    = 0x08
-EFI_FILE_DELETED              = 0x10
-EFI_FILE_HEADER_INVALID       = 0x20
-
-class EFI_FFS_FILE_HEADER(Structure):
-    _fields_ = [
-        ('Name',                 GUID),
-        ('IntegrityCheck',       c_uint16),
-        ('Type',                 c_uint8),
-        ('Attributes',           c_uint8),
-        ('Size',                 ARRAY(c_uint8, 3)),
-        ('State',                c_uint8),
-        ]
-
-class EFI_FFS_FILE_HEADER2(Structure):
-    _fields_ = [
-        ('Name',                 GUID),
-        ('IntegrityCheck',       c_uint16),
-        ('Type',                 c_uint8),
-        ('Attributes',           c_uint8),
-        ('Size',                 ARRAY(c_uint8, 3)),
-        ('State',                c_uint8),
-        ('ExtendedSize',         c_uint64),
-        ]
-
-#
-# Pseudo type. It is used as a wild card when retrieving sections.
-#  The section type EFI_SECTION_ALL matches all section types.
-#
-EFI_SECTION_ALL                   = 0x00
+from   multiprocessing.pool import ThreadPool
+from   FvLib  import *
+from   ReportLib import *
 
 #
-# Encapsulation section Type values.
+# FILE_GUID of the source INF files, cached in the destination root and
+# reused for the INF files whose size and mtime did not change
 #
-EFI_SECTION_COMPRESSION           = 0x01
-
-EFI_SECTION_GUID_DEFINED          = 0x02
-
-EFI_SECTION_DISPOSABLE            = 0x03
-
-#
-# Leaf section Type values.
-#
-EFI_SECTION_PE32                  = 0x10
-EFI_SECTION_PIC                   = 0x11
-EFI_SECTION_TE                    = 0x12
-EFI_SECTION_DXE_DEPEX             = 0x13
-EFI_SECTION_VERSION               = 0x14
-EFI_SECTION_USER_INTERFACE        = 0x15
-EFI_SECTION_COMPATIBILITY16       = 0x16
-EFI_SECTION_FIRMWARE_VOLUME_IMAGE = 0x17
-EFI_SECTION_FREEFORM_SUBTYPE_GUID = 0x18
-EFI_SECTION_RAW                   = 0x19
-EFI_SECTION_PEI_DEPEX             = 0x1B
-EFI_SECTION_SMM_DEPEX             = 0x1C
-
-class EFI_COMMON_SECTION_HEADER(Structure):
-    _fields_ = [
-        ('Size',                 ARRAY(c_uint8, 3)),
-        ('Type',                 c_uint8),
-        ]
-
-class EFI_COMMON_SECTION_HEADER2(Structure):
-    _fields_ = [
-        ('Size',                 ARRAY(c_uint8, 3)),
-        ('Type',                 c_uint8),
-        ('ExtendedSize',         c_uint32),
-        ]
+INF_GUID_CACHE_FILE    = "SyncBinFvInf.InfGuid.json"
+INF_GUID_CACHE_VERSION = 1
+INF_GUID_THREADS       = 8
 
 class FileChecker:
     def __init__(self):
@@ -155,6 +37,7 @@ class FileChecker:
         self.target = ""
         self.sourceRoot = ""
         self.sourceInfList = []
+        self.InfGuidDict = None
         self.destRoot = ""
         self.reportFile = ""
 
@@ -215,12 +98,68 @@ class FileChecker:
             file.close()
         return guid
 
+    #
+    # Build the FILE_GUID -> INF file dictionary of fileList. The GUID of each
+    # INF file is read once, the INF files missing from the cache are read
+    # by a thread pool.
+    #
+    def GetInfGuidDict(self, fileList):
+        cacheFile = os.path.join(self.destRoot, INF_GUID_CACHE_FILE)
+        cache = {}
+        try:
+            with open(cacheFile) as file:
+                index = json.load(file)
+            if index["Version"] == INF_GUID_CACHE_VERSION:
+                cache = index["Files"]
+        except (EnvironmentError, ValueError, KeyError, TypeError):
+            cache = {}
+
+        fileStat = {}
+        fileGuid = {}
+        missList = []
+        for fileName in fileList:
+            try:
+                stat = os.stat(fileName)
+            except EnvironmentError:
+                continue
+            fileStat[fileName] = [stat.st_mtime, stat.st_size]
+            entry = cache.get(fileName)
+            if (entry is not None) and (entry[0:2] == fileStat[fileName]):
+                fileGuid[fileName] = entry[2]
+            else:
+                missList.append(fileName)
+
+        if len(missList) > 0:
+            pool = ThreadPool(min(len(missList), INF_GUID_THREADS))
+            try:
+                guidList = pool.map(self.GetInfFileGuid, missList)
+            finally:
+                pool.close()
+                pool.join()
+            for (fileName, guid) in zip(missList, guidList):
+                fileGuid[fileName] = guid or ""
+
+        newCache = {}
+        for fileName in fileGuid:
+            newCache[fileName] = fileStat[fileName] + [fileGuid[fileName]]
+        if newCache != cache:
+            try:
+                with open(cacheFile, "w") as file:
+                    json.dump({"Version" : INF_GUID_CACHE_VERSION, "Files" : newCache}, file)
+            except EnvironmentError:
+                pass
+
+        guidDict = {}
+        for fileName in fileList:
+            guid = fileGuid.get(fileName, "").upper()
+            if (guid != "") and (guid not in guidDict):
+                guidDict[guid] = fileName
+        return guidDict
+
     def GetInfNameFromGuid(self, fileList, guid):
-        for file in fileList:
-            fileGuid = self.GetInfFileGuid (file)
-            if (cmp (fileGuid.upper(), guid.upper()) == 0) :
-                return file
-        return ""
+        if self.InfGuidDict is None:
+            self.InfGuidDict = self.GetInfGuidDict (fileList)
+        return self.InfGuidDict.get(guid.upper(), "")
 
     def CheckSourceInf(self, file):
         if (cmp (file[-4:], ".inf") == 0) and (file.find("BinPkg") != -1) and (file.find(self.target) != -1) and (file.find("FVFSP") == -1):
@@ -298,14 +237,16 @@ class FileChecker:
             destFile.close()
         return
 
-    def GetGuildFfsGuidList(self, fileName):
-        self.FfsGuidList = []
-        self.FfsOffsetList = []
+    #
+    # Get the (FFS offset, FFS GUID) list of the GenFv map file
+    #
+    def GetFfsMapList(self, fileName):
+        MapList = []
         try :
             file = open(fileName)
         except Exception:
             print "fail to open " + fileName
-            return
+            return None
         try:
             while 1:
                 line = file.readline()
@@ -316,15 +257,18 @@ class FileChecker:
                 MatchString = "(0x[0-9a-fA-F]{8}) ([0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})"
                 match = re.match(MatchString, line)
                 if match is not None:
-                    offset = match.group(1)
-                    self.FfsOffsetList.append(offset)
-                    ffsGuid = match.group(2)
-                    self.FfsGuidList.append(ffsGuid)
+                    MapList.append((int(match.group(1), 16), match.group(2).upper()))
         finally:
             file.close()
-        return
+        return MapList
 
-    def GetPeOffsetList(self, fileName):
+    #
+    # Walk the FFS files of the binary FV once, collecting the GUID and the
+    # offset of each FFS file and the offset of its PE/TE image
+    #
+    def GetFfsListFromFv(self, fileName):
+        self.FfsGuidList = []
+        self.FfsOffsetList = []
         self.PeOffsetList = []
         try :
             file = open(fileName, "rb")
@@ -332,48 +276,69 @@ class FileChecker:
             print "fail to open " + fileName
             return
         try:
-            FvBuffer = file.read()
-            FvData = bytearray(FvBuffer)
-
-            for FfsOffset in self.FfsOffsetList:
-                PeOffsetFound = False
-                PeOffset = int(FfsOffset, 16)
-                FfsHeader = EFI_FFS_FILE_HEADER.from_buffer (FvData, PeOffset)
-                FfsSize = FfsHeader.Size[0] + (FfsHeader.Size[1] << 8) + (FfsHeader.Size[2] << 16)
-                PeOffset = PeOffset + sizeof(EFI_FFS_FILE_HEADER)
-                while (PeOffset < int(FfsOffset, 16) + FfsSize) :
-                    SectionHeader = EFI_COMMON_SECTION_HEADER.from_buffer (FvData, PeOffset)
-                    if (SectionHeader.Type == EFI_SECTION_PE32) or (SectionHeader.Type == EFI_SECTION_TE) :
-                        PeOffset = PeOffset + sizeof(EFI_COMMON_SECTION_HEADER)
-                        self.PeOffsetList.append(hex(PeOffset))
-                        PeOffsetFound = True
-                        break
+            #
+            # Parse the headers in place from a memory mapping of the FV,
+            # the copy-on-write mapping is never written so nothing is
+            # copied. Fall back to reading the FV if it cannot be mapped.
+            #
+            try:
+                FvData = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+            except (EnvironmentError, ValueError):
+                FvData = bytearray(file.read())
+            try:
+                Fv = FirmwareVolume (FvData)
+                for Ffs in Fv.GetFfsList():
+                    if Ffs.IsPad():
+                        continue
+                    self.FfsGuidList.append(Ffs.Name)
+                    self.FfsOffsetList.append("0x%08X" % Ffs.Offset)
+                    # only a top level image section may be patched
+                    Sec = Ffs.FindImageSection ()
+                    if Sec is not None:
+                        self.PeOffsetList.append(hex(Sec.DataOffset))
                     else:
-                        SectionSize = SectionHeader.Size[0] + (SectionHeader.Size[1] << 8) + (SectionHeader.Size[2] << 16)
-                        PeOffset = (PeOffset + SectionSize + 3) & ~0x3
-                if (PeOffsetFound == False):
                         self.PeOffsetList.append(0)
-
+            finally:
+                if isinstance(FvData, mmap.mmap):
+                    FvData.close()
         finally:
             file.close()
         return
 
+    #
+    # The FFS list is taken from the binary FV, the GenFv map file, if any,
+    # is only used to check it
+    #
+    def CheckFfsMap(self, fileName):
+        if not os.path.exists(fileName):
+            return True
+        MapList = self.GetFfsMapList (fileName)
+        if MapList is None:
+            return False
+        FvList = zip([int(offset, 16) for offset in self.FfsOffsetList], self.FfsGuidList)
+        if MapList == FvList:
+            return True
+        print "WARNING: " + fileName + " does not match the FV"
+        for (offset, guid) in sorted(set(MapList) - set(FvList)):
+            print "    map only - " + hex(offset) + " " + guid
+        for (offset, guid) in sorted(set(FvList) - set(MapList)):
+            print "    FV only  - " + hex(offset) + " " + guid
+        return False
+
     def ProcessFvInf(self, fvName, RebasePcd):
-        destFile = os.path.join(self.destRoot,fvName+"\\"+self.target+"\\"+fvName+".Fv.txt")
+        destFile = os.path.join(self.destRoot,fvName+"\\"+self.target+"\\"+fvName+".Fv")
         print "\nprocessing - " + destFile
-        self.GetGuildFfsGuidList (destFile)
+        self.GetFfsListFromFv (destFile)
 
         #print "FfsGuidList"
         #self.PrintList(self.FfsGuidList)
         #print "FfsOffsetList"
         #self.PrintList(self.FfsOffsetList)
-
-        destFile = os.path.join(self.destRoot,fvName+"\\"+self.target+"\\"+fvName+".Fv")
-        self.GetPeOffsetList (destFile)
-
         #print "PeOffsetList"
         #self.PrintList(self.PeOffsetList)
 
+        self.CheckFfsMap (destFile + ".txt")
+
         self.FfsInfList = []
         for guid in self.FfsGuidList:
             fileName = self.GetInfNameFromGuid(self.sourceInfList, guid)
@@ -387,56 +352,15 @@ class FileChecker:
 
         self.ParseInfFiles (self.FfsInfList, self.PeOffsetList, os.path.join(self.destRoot,fvName+"\\"+self.target+"\\"+fvName+".inf"), RebasePcd)
 
-    def GetPcdFromReport(self, file, pcd):
-        FoundPkg = False
-        pcdSplit = pcd.split(".")
-        TargetPkg = pcdSplit[0]
-        TargetPcd = pcdSplit[1]
-        while 1:
-            line = file.readline()
-            if not line:
-                break
-
-            newline = line[:-1]
-
-            if (cmp (newline, TargetPkg) == 0):
-                FoundPkg = True
-                continue
-
-            if (cmp (newline, "") == 0) or ((cmp (newline[0], " ") != 0) and (cmp (newline[0], "0") != 0)):
-                FoundPkg = False
-
-            if (FoundPkg == True) :
-                newline = newline.strip()
-                splitLine = newline.split(" ", 2)
-                if (cmp (splitLine[0], "*F") == 0) or (cmp (splitLine[0], "*P") == 0):
-                    if (cmp (splitLine[1], TargetPcd) == 0):
-                        print "found - " + TargetPkg + "." + TargetPcd
-
-                        splitLine = splitLine[2].strip()[1:].strip().split(" ", 1)
-                        if (cmp (splitLine[0], "FIXED") == 0) or (cmp (splitLine[0], "PATCH") == 0):
-                            SplitLine = splitLine[1].strip()[1:].split(")", 1)
-                            Type = SplitLine[0]
-                            Value = SplitLine[1].strip()[1:].strip().split()[0]
-                            print "  Type - (" + Type + "), Value - (" + Value + ")"
-                            return [Value, Type]
-        return ["", ""]
-
     def GetRebaseAddressFromReport(self):
-        try :
-            file = open(self.reportFile)
-        except Exception:
-            print "fail to open " + self.reportFile
+        report = LoadBuildReport (self.reportFile)
+        if report is None:
             return
-        try:
-            file.seek(0)
-            if (cmp(self.RebasePcd[0], "") != 0):
-                print "checking - " + self.RebasePcd[0]
-                ValuePair = self.GetPcdFromReport (file, self.RebasePcd[0])
-                self.RebasePcd[1] = ValuePair[0]
-                self.RebasePcd[2] = ValuePair[1]
-        finally:
-            file.close()
+        if (cmp(self.RebasePcd[0], "") != 0):
+            print "checking - " + self.RebasePcd[0]
+            ValuePair = report.GetPcd (self.RebasePcd[0])
+            self.RebasePcd[1] = ValuePair[0]
+            self.RebasePcd[2] = ValuePair[1]
 
     def DumpFileList(self, dir):
         #print "DumpFileList - " + dir
@@ -16,12 +16,33 @@ imported functions from board directory
 import os
 import re
 import sys
+import json
+import time
+import hashlib
 import signal
 import shutil
+import logging
+import threading
+import collections
 import argparse
+import tempfile
 import traceback
+import contextlib
 import subprocess
-from importlib import import_module
+import multiprocessing
+import logging.handlers
+
+try:
+    # python 3.5 and later
+    import importlib.util
+except ImportError:
+    import importlib
+
+try:
+    # not available on windows
+    import resource
+except ImportError:
+    resource = None
 
 try:
     # python 2.7
@@ -31,6 +52,176 @@ except ImportError:
     import configparser
 
 
+# Serializes the tools build between parallel board build jobs,
+# set by the job pool initializer
+TOOLS_BUILD_LOCK = None
+
+# Set in the parallel build job processes, which ignore SIGINT
+BUILD_JOB_PROCESS = False
+
+# Records the build phases when profiling is enabled
+PROFILER = None
+
+# Custom build scripts of the platforms, keyed by path
+PLATFORM_LIBS = {}
+
+# Number of output lines execute_script keeps in streaming mode
+STREAM_TAIL_LINES = 1000
+
+# Size and number of the rotating logs of execute_script streaming mode
+STREAM_LOG_MAX_BYTES = 64 * 1024 * 1024
+STREAM_LOG_BACKUP_COUNT = 3
+
+# Output lines of the EDK2 build command marking the start of its steps
+EDK2_BUILD_MARKERS = ["Processing meta-data", "Generating code",
+                      "Generating makefile", "Fd Generation",
+                      "GenFds"]
+
+# The rebased FSP binaries, Fsp_Rebased.fd is the concatenation
+# of the parts
+FSP_REBASED_PARTS = ["Fsp_Rebased_S.fd", "Fsp_Rebased_M.fd",
+                     "Fsp_Rebased_T.fd"]
+FSP_REBASED_FILES = ["Fsp_Rebased.fd"] + FSP_REBASED_PARTS
+
+# Buffer size of file copies that can not be done by the kernel
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Default size limit of the rebased FSP cache in bytes
+FSP_REBASE_CACHE_SIZE = 256 * 1024 * 1024
+
+
+class BuildProfiler(object):
+    """Records the wall time, CPU time, peak RSS and exit code of the
+    build phases and the commands they execute as Chrome trace events
+    """
+
+    def __init__(self):
+        self.events = []
+
+    @staticmethod
+    def get_usage():
+        """Gets the CPU time of this process and its children and the
+        peak RSS of the largest of them
+
+            :returns: user time, system time, peak RSS in KB
+            :rtype: Tuple
+        """
+        if resource is None:
+            times = os.times()
+            return (times[0] + times[2], times[1] + times[3], 0)
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return (own.ru_utime + children.ru_utime,
+                own.ru_stime + children.ru_stime,
+                max(own.ru_maxrss, children.ru_maxrss))
+
+    def begin(self, name, category, args=None):
+        """Starts an event
+
+            :param name: The phase or command name
+            :type name: String
+            :param category: The event category, phase or command
+            :type category: String
+            :param args: Additional event details
+            :type args: Dictionary
+            :returns: The event
+            :rtype: Dictionary
+        """
+        event = {"name": name,
+                 "cat": category,
+                 "ph": "X",
+                 "pid": os.getpid(),
+                 "tid": 0,
+                 "ts": time.time() * 1000000,
+                 "args": dict(args or {}),
+                 "usage": self.get_usage()}
+        return event
+
+    def end(self, event, exit_code):
+        """Completes and records an event
+
+            :param event: The event returned by begin
+            :type event: Dictionary
+            :param exit_code: The exit code of the phase or command
+            :type exit_code: Integer
+            :returns: nothing
+        """
+        user_time, system_time, peak_rss = self.get_usage()
+        start_user_time, start_system_time, _ = event.pop("usage")
+        event["dur"] = time.time() * 1000000 - event["ts"]
+        event["args"].setdefault("exit_code", exit_code)
+        event["args"]["user_time"] = user_time - start_user_time
+        event["args"]["system_time"] = system_time - start_system_time
+        event["args"]["peak_rss_kb"] = peak_rss
+        self.events.append(event)
+
+    def mark(self, name, args=None):
+        """Records an instant event
+
+            :param name: The progress marker name
+            :type name: String
+            :param args: Additional event details
+            :type args: Dictionary
+            :returns: nothing
+        """
+        self.events.append({"name": name,
+                            "cat": "progress",
+                            "ph": "i",
+                            "s": "p",
+                            "pid": os.getpid(),
+                            "tid": 0,
+                            "ts": time.time() * 1000000,
+                            "args": dict(args or {})})
+
+    def write(self, path):
+        """Writes the events as a Chrome trace file
+
+            :param path: The trace file path
+            :type path: String
+            :returns: nothing
+        """
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": self.events,
+                       "displayTimeUnit": "ms"}, trace_file, indent=1)
+        print("Build profile can be found at {}".format(path))
+
+
+@contextlib.contextmanager
+def profile_phase(name, category="phase", args=None):
+    """Profiles the enclosed code when profiling is enabled
+
+        :param name: The phase or command name
+        :type name: String
+        :param category: The event category, phase or command
+        :type category: String
+        :param args: Additional event details
+        :type args: Dictionary
+        :returns: The event or None if profiling is disabled
+        :rtype: Dictionary
+    """
+    if PROFILER is None:
+        yield None
+        return
+
+    event = PROFILER.begin(name, category, args)
+    exit_code = 0
+    try:
+        yield event
+    except SystemExit as error:
+        if error.code is None or isinstance(error.code, int):
+            exit_code = error.code or 0
+        else:
+            exit_code = 1
+        raise
+    except Exception:
+        exit_code = 1
+        raise
+    finally:
+        PROFILER.end(event, exit_code)
+
+
 def pre_build(build_config, build_type="DEBUG", silent=False, toolchain=None):
     """Sets the environment variables that shall be used for the build
 
@@ -57,9 +248,6 @@ def pre_build(build_config, build_type="DEBUG", silent=False, toolchain=None):
     # update the current config with the build config
     config.update(build_config)
 
-    # make the config and build python 2.7 compartible
-    config = py_27_fix(config)
-
     # Set WORKSPACE environment.
     config["WORKSPACE"] = os.path.abspath(os.path.join("..", "..", "..", ""))
     print("Set WORKSPACE as: {}".format(config["WORKSPACE"]))
@@ -73,16 +261,19 @@ def pre_build(build_config, build_type="DEBUG", silent=False, toolchain=None):
                 and has been added to system path.")
         sys.exit(1)
 
-    # Create the Conf directory under WORKSPACE
-    if not os.path.isdir(os.path.join(config["WORKSPACE"], "Conf")):
+    # Create the Conf directory, a parallel build job brings its own
+    if not build_config.get("CONF_PATH"):
+        build_config["CONF_PATH"] = os.path.join(config["WORKSPACE"], "Conf")
+    config["CONF_PATH"] = build_config["CONF_PATH"]
+    if not os.path.isdir(config["CONF_PATH"]):
         try:
             # create directory
-            os.makedirs(os.path.join(config["WORKSPACE"], "Conf"))
+            os.makedirs(config["CONF_PATH"])
             # copy files to it
             config_template_path = os.path.join(config["WORKSPACE"],
                                                 config["BASE_TOOLS_PATH"],
                                                 "Conf")
-            config_path = os.path.join(config["WORKSPACE"], "Conf")
+            config_path = config["CONF_PATH"]
             shutil.copyfile(config_template_path +
                             os.sep + "target.template",
                             config_path + os.sep + "target.txt")
@@ -145,7 +336,6 @@ def pre_build(build_config, build_type="DEBUG", silent=False, toolchain=None):
                                          config['PROJECT_DSC'])
     config['BOARD_PKG_PCD_DSC'] = os.path.join(config["WORKSPACE_PLATFORM"],
                                                config['BOARD_PKG_PCD_DSC'])
-    config["CONF_PATH"] = os.path.join(config["WORKSPACE"], "Conf")
 
     # get the python path
     if os.environ.get("PYTHON_HOME") is None:
@@ -166,60 +356,16 @@ def pre_build(build_config, build_type="DEBUG", silent=False, toolchain=None):
         if config.get("EDK_TOOLS_BIN") is not None:
             del config["EDK_TOOLS_BIN"]
 
-    # Run edk setup and  update config
-    if os.name == 'nt':
-        edk2_setup_cmd = [os.path.join(config["EFI_SOURCE"], "edksetup"),
-                          "Rebuild"]
-
-        if config.get("EDK_SETUP_OPTION") and \
-           config["EDK_SETUP_OPTION"] != " ":
-            edk2_setup_cmd.append(config["EDK_SETUP_OPTION"])
-
-        _, _, result, return_code = execute_script(edk2_setup_cmd,
-                                                   config,
-                                                   collect_env=True,
-                                                   shell=True)
-        if return_code == 0 and result is not None and isinstance(result,
-                                                                  dict):
-            config.update(result)
-
-    # nmake BaseTools source
-    # and enable BaseTools source build
-    shell = True
-    command = ["nmake", "-f", os.path.join(config["BASE_TOOLS_PATH"],
-                                           "Makefile")]
-    if os.name == "posix":  # linux
-        shell = False
-        command = ["make", "-C", os.path.join(config["BASE_TOOLS_PATH"])]
-
-    _, _, result, return_code = execute_script(command, config, shell=shell)
-    if return_code != 0:
-        build_failed(config)
-
-    #
-    # build platform silicon tools
-    #
-    # save the current workspace
-    saved_work_directory = config["WORKSPACE"]
-    # change the workspace to silicon tools directory
-    config["WORKSPACE"] = os.path.join(config["WORKSPACE_SILICON"], "Tools")
-
-    command = ["nmake"]
-    if os.name == "posix":  # linux
-        command = ["make"]
-        # add path to generated FitGen binary to
-        # environment path variable
-        config["PATH"] += os.pathsep + \
-                          os.path.join(config["BASE_TOOLS_PATH"],
-                                       "Source", "C", "bin")
-
-    # build the silicon tools
-    _, _, result, return_code = execute_script(command, config, shell=shell)
-    if return_code != 0:
-        build_failed(config)
-
-    # restore WORKSPACE environment variable
-    config["WORKSPACE"] = saved_work_directory
+    # Parallel board builds share the BaseTools and silicon tools trees,
+    # only one of them may build the tools at a time
+    if TOOLS_BUILD_LOCK is not None:
+        TOOLS_BUILD_LOCK.acquire()
+    try:
+        with profile_phase("build_tools"):
+            build_tools(config)
+    finally:
+        if TOOLS_BUILD_LOCK is not None:
+            TOOLS_BUILD_LOCK.release()
 
     config["SILENT_MODE"] = 'TRUE' if silent else 'FALSE'
 
@@ -311,6 +457,311 @@ def pre_build(build_config, build_type="DEBUG", silent=False, toolchain=None):
     return config
 
 
+def build_tools(config):
+    """Runs edksetup and builds BaseTools and the silicon tools
+
+        :param config: The environment variables to be used
+            in the build process
+        :type config: Dictionary
+        :returns: nothing
+    """
+    # Run edk setup and  update config
+    if os.name == 'nt':
+        edk2_setup_cmd = [os.path.join(config["EFI_SOURCE"], "edksetup"),
+                          "Rebuild"]
+
+        if config.get("EDK_SETUP_OPTION") and \
+           config["EDK_SETUP_OPTION"] != " ":
+            edk2_setup_cmd.append(config["EDK_SETUP_OPTION"])
+
+        # reuse the environment edksetup produced for the same script,
+        # options and incoming environment
+        env_cache = os.path.join(config["WORKSPACE"], "Build", "EdkSetupEnv",
+                                 "{}.json".format(
+                                     get_edk_setup_key(config,
+                                                       edk2_setup_cmd)))
+        result = load_edk_setup_env(env_cache)
+        if result is not None:
+            print("Using cached edksetup environment {}".format(env_cache))
+            config.update(result)
+        else:
+            _, _, result, return_code = execute_script(
+                edk2_setup_cmd, config, collect_env=True, shell=True,
+                stream_output=True,
+                log_file=get_command_log(config, "edksetup"))
+            if return_code == 0 and result is not None and \
+               isinstance(result, dict):
+                # keep only what edksetup changed
+                delta = dict((key, value) for key, value in result.items()
+                             if config.get(key) != value)
+                store_edk_setup_env(env_cache, delta)
+                config.update(result)
+
+    # skip the tools build if neither the tools sources nor the
+    # compiler and PATH changed since the last successful build
+    tools_dirs = [config["BASE_TOOLS_PATH"],
+                  os.path.join(config["WORKSPACE_SILICON"], "Tools")]
+    tools_stamp = os.path.join(config["WORKSPACE"], "Build",
+                               "ToolsStamp.json")
+    tools_key = get_tools_key(config)
+    build_required = config.get("FORCE_TOOLS_BUILD", "FALSE") == "TRUE" or \
+        not is_tools_stamp_valid(tools_stamp, tools_dirs, tools_key)
+
+    # nmake BaseTools source
+    # and enable BaseTools source build
+    shell = True
+    command = ["nmake", "-f", os.path.join(config["BASE_TOOLS_PATH"],
+                                           "Makefile")]
+    if os.name == "posix":  # linux
+        shell = False
+        command = ["make", "-C", os.path.join(config["BASE_TOOLS_PATH"])]
+
+    if build_required:
+        _, _, result, return_code = execute_script(
+            command, config, shell=shell, stream_output=True,
+            log_file=get_command_log(config, "BaseTools"))
+        if return_code != 0:
+            build_failed(config)
+
+    #
+    # build platform silicon tools
+    #
+    silicon_tools_log = get_command_log(config, "SiliconTools")
+    # save the current workspace
+    saved_work_directory = config["WORKSPACE"]
+    # change the workspace to silicon tools directory
+    config["WORKSPACE"] = os.path.join(config["WORKSPACE_SILICON"], "Tools")
+
+    command = ["nmake"]
+    if os.name == "posix":  # linux
+        command = ["make"]
+        # add path to generated FitGen binary to
+        # environment path variable
+        config["PATH"] += os.pathsep + \
+                          os.path.join(config["BASE_TOOLS_PATH"],
+                                       "Source", "C", "bin")
+
+    # build the silicon tools
+    if build_required:
+        _, _, result, return_code = execute_script(
+            command, config, shell=shell, stream_output=True,
+            log_file=silicon_tools_log)
+        if return_code != 0:
+            build_failed(config)
+
+    # restore WORKSPACE environment variable
+    config["WORKSPACE"] = saved_work_directory
+
+    if build_required:
+        write_tools_stamp(tools_stamp, tools_dirs, tools_key)
+    else:
+        print("BaseTools and silicon tools are up to date, "
+              "use --force-tools to rebuild them")
+
+
+def get_edk_setup_key(config, command):
+    """Gets the cache key of the environment produced by edksetup
+
+        :param config: The environment variables edksetup is run with
+        :type config: Dictionary
+        :param command: The edksetup command line
+        :type command: List:String
+        :returns: The hex digest of the edksetup scripts, the command
+            line and the environment
+        :rtype: String
+    """
+    digest = hashlib.sha256()
+    for script in [os.path.join(config["WORKSPACE"], config["EFI_SOURCE"],
+                                "edksetup.bat"),
+                   os.path.join(config["BASE_TOOLS_PATH"], "toolsetup.bat")]:
+        try:
+            with open(script, "rb") as script_file:
+                digest.update(script_file.read())
+        except (IOError, OSError):
+            pass
+    digest.update(" ".join(command).encode("utf-8"))
+    for key in sorted(config):
+        digest.update("{}={}\n".format(key, config[key]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_edk_setup_env(env_cache):
+    """Loads a cached edksetup environment
+
+        :param env_cache: The cache file path
+        :type env_cache: String
+        :returns: The environment variables edksetup changed, None if
+            they are not cached
+        :rtype: Dictionary
+    """
+    try:
+        with open(env_cache, "r") as cache_file:
+            return dict((str(key), str(value)) for key, value
+                        in json.load(cache_file).items())
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+def store_edk_setup_env(env_cache, env):
+    """Caches the environment variables edksetup changed
+
+        :param env_cache: The cache file path
+        :type env_cache: String
+        :param env: The environment variables edksetup changed
+        :type env: Dictionary
+        :returns: nothing
+    """
+    try:
+        if not os.path.isdir(os.path.dirname(env_cache)):
+            os.makedirs(os.path.dirname(env_cache))
+        with open(env_cache, "w") as cache_file:
+            json.dump(env, cache_file)
+    except (IOError, OSError):
+        print("Error while writing {}".format(env_cache))
+
+
+def get_tools_key(config):
+    """Gets the compiler version and PATH the tools are built with
+
+        :param config: The environment variables to be used
+            in the build process
+        :type config: Dictionary
+        :returns: The hex digest of the compiler version and PATH
+        :rtype: String
+    """
+    if os.name == "posix":
+        command = [config.get("CC", "gcc"), "--version"]
+    else:
+        command = ["cl"]
+
+    version = ""
+    try:
+        process = subprocess.Popen(command, env=config,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   universal_newlines=True)
+        std_out, stderr = process.communicate()
+        # cl prints its version banner to stderr
+        version = (std_out + stderr).strip().split("\n")[0]
+    except OSError:
+        pass
+
+    digest = hashlib.sha256()
+    digest.update(version.encode("utf-8"))
+    digest.update(config.get("PATH", "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_tools_files(tools_dirs):
+    """Gets the size and modification time of all files in the tools trees
+
+        :param tools_dirs: The tools source directories
+        :type tools_dirs: List:String
+        :returns: [modification time, size] keyed by file path
+        :rtype: Dictionary
+    """
+    files = {}
+    for tools_dir in tools_dirs:
+        for root, dirs, names in os.walk(tools_dir):
+            # python byte code changes whenever a tool runs
+            dirs[:] = [name for name in dirs
+                       if name not in ("__pycache__", ".git")]
+            for name in names:
+                if name.endswith(".pyc"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = [stat.st_mtime, stat.st_size]
+    return files
+
+
+def get_tools_content_hash(files):
+    """Hashes the path and content of the tools files
+
+        :param files: The files returned by get_tools_files
+        :type files: Dictionary
+        :returns: The hex digest of the files
+        :rtype: String
+    """
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        digest.update(path.encode("utf-8"))
+        try:
+            with open(path, "rb") as tool_file:
+                for chunk in iter(lambda: tool_file.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        except (IOError, OSError):
+            pass
+    return digest.hexdigest()
+
+
+def is_tools_stamp_valid(tools_stamp, tools_dirs, tools_key):
+    """Checks whether the tools are up to date with their stamp file
+
+        The modification time and size of each file are compared first,
+        the content is only hashed if they differ.
+
+        :param tools_stamp: The stamp file path
+        :type tools_stamp: String
+        :param tools_dirs: The tools source directories
+        :type tools_dirs: List:String
+        :param tools_key: The digest returned by get_tools_key
+        :type tools_key: String
+        :returns: True if the tools need not be built
+        :rtype: Boolean
+    """
+    try:
+        with open(tools_stamp, "r") as stamp_file:
+            stamp = json.load(stamp_file)
+    except (IOError, OSError, ValueError):
+        return False
+
+    if stamp.get("key") != tools_key:
+        return False
+
+    files = get_tools_files(tools_dirs)
+    if files == stamp.get("files"):
+        return True
+
+    if sorted(files) != sorted(stamp.get("files", {})) or \
+       get_tools_content_hash(files) != stamp.get("content"):
+        return False
+
+    # only the modification times changed, refresh the stamp
+    write_tools_stamp(tools_stamp, tools_dirs, tools_key, files)
+    return True
+
+
+def write_tools_stamp(tools_stamp, tools_dirs, tools_key, files=None):
+    """Records the state of the tools after a successful build
+
+        :param tools_stamp: The stamp file path
+        :type tools_stamp: String
+        :param tools_dirs: The tools source directories
+        :type tools_dirs: List:String
+        :param tools_key: The digest returned by get_tools_key
+        :type tools_key: String
+        :param files: The files returned by get_tools_files
+        :type files: Dictionary
+        :returns: nothing
+    """
+    if files is None:
+        files = get_tools_files(tools_dirs)
+    stamp = {"key": tools_key,
+             "files": files,
+             "content": get_tools_content_hash(files)}
+    try:
+        if not os.path.isdir(os.path.dirname(tools_stamp)):
+            os.makedirs(os.path.dirname(tools_stamp))
+        with open(tools_stamp, "w") as stamp_file:
+            json.dump(stamp, stamp_file)
+    except (IOError, OSError):
+        print("Error while writing {}".format(tools_stamp))
+
+
 def build(config):
     """Builds the BIOS image
 
@@ -321,47 +772,13 @@ def build(config):
     """
 
     if config["FSP_WRAPPER_BUILD"] == "TRUE":
-        pattern = "Fsp_Rebased.*\\.fd$"
-        file_dir = os.path.join(config['WORKSPACE_FSP_BIN'],
-                                config['FSP_BIN_PKG'])
-        for item in os.listdir(file_dir):
-            if re.search(pattern, item):
-                os.remove(os.path.join(file_dir, item))
-
-        command = [os.path.join(config['PYTHON_HOME'], "python"),
-                   os.path.join(config['WORKSPACE_PLATFORM'],
-                                config['PLATFORM_PACKAGE'],
-                                'Tools', 'Fsp',
-                                'RebaseFspBinBaseAddress.py'),
-                   os.path.join(config['WORKSPACE_PLATFORM'],
-                                config['FLASH_MAP_FDF']),
-                   os.path.join(config['WORKSPACE_FSP_BIN'],
-                                config['FSP_BIN_PKG']),
-                   "Fsp.fd",
-                   "0x0"]
-
-        _, _, _, return_code = execute_script(command, config, shell=False)
+        with profile_phase("fsp_rebase"):
+            rebase_fsp(config)
 
-        if return_code != 0:
-            print("ERROR:RebaseFspBinBaseAddress failed")
-            sys.exit(return_code)
-
-        # create Fsp_Rebased.fd which is Fsp_Rebased_S.fd +
-        # Fsp_Rebased_M + Fsp_Rebased_T
-        with open(os.path.join(file_dir, "Fsp_Rebased_S.fd"), 'rb') as fsp_s, \
-                open(os.path.join(file_dir,
-                                  "Fsp_Rebased_M.fd"), 'rb') as fsp_m, \
-                open(os.path.join(file_dir,
-                                  "Fsp_Rebased_T.fd"), 'rb') as fsp_t:
-
-            fsp_rebased = fsp_s.read() + fsp_m.read() + fsp_t.read()
-            with open(os.path.join(file_dir,
-                                   "Fsp_Rebased.fd"), 'wb') as new_fsp:
-                new_fsp.write(fsp_rebased)
-
-        if not os.path.isfile(os.path.join(file_dir, "Fsp_Rebased.fd")):
-            print("!!! ERROR:failed to create fsp!!!")
-            sys.exit(1)
+        # Additional scripts for the rebased FSP of this platform
+        result = post_rebase_ex(config)
+        if result is not None and isinstance(result, dict):
+            config.update(result)
 
     # Output the build variables the user has selected.
     print("==========================================")
@@ -409,7 +826,13 @@ def build(config):
     if os.name == "posix":
         shell = False
 
-    _, _, _, exit_code = execute_script(command, config, shell=shell)
+    progress = BuildProgress()
+    _, _, _, exit_code = execute_script(command, config, shell=shell,
+                                        stream_output=True,
+                                        log_file=get_command_log(config,
+                                                                 "build"),
+                                        progress=progress)
+    print("EDK2 build processed {} modules".format(progress.modules))
     if exit_code != 0:
         build_failed(config)
 
@@ -421,6 +844,369 @@ def build(config):
     return config
 
 
+def rebase_fsp(config):
+    """Rebases the FSP binary and creates Fsp_Rebased.fd
+
+        :param config: The environment variables to be used
+            in the build process
+        :type config: Dictionary
+        :returns: nothing
+    """
+    pattern = "Fsp_Rebased.*\\.(fd|json)$"
+    file_dir = os.path.join(config['WORKSPACE_FSP_BIN'],
+                            config['FSP_BIN_PKG'])
+    for item in os.listdir(file_dir):
+        if re.search(pattern, item):
+            os.remove(os.path.join(file_dir, item))
+
+    rebase_script = os.path.join(config['WORKSPACE_PLATFORM'],
+                                 config['PLATFORM_PACKAGE'],
+                                 'Tools', 'Fsp',
+                                 'RebaseFspBinBaseAddress.py')
+    flash_map = os.path.join(config['WORKSPACE_PLATFORM'],
+                             config['FLASH_MAP_FDF'])
+    split_fsp_bin = os.path.join(config['WORKSPACE'],
+                                 config['WORKSPACE_CORE'],
+                                 'IntelFsp2Pkg', 'Tools', 'SplitFspBin.py')
+
+    try:
+        rebase_lib = load_module("RebaseFspBinBaseAddress", rebase_script)
+    except Exception as error:
+        # fall back to the RebaseFspBinBaseAddress.py command, which gets
+        # the FSP base addresses itself, without the cache
+        print("In process FSP rebase is not available: {}".format(error))
+        rebase_fsp_script(config, rebase_script, flash_map, file_dir)
+        if not write_fsp_rebased_manifest(file_dir):
+            print("!!! ERROR:failed to create fsp!!!")
+            sys.exit(1)
+        return
+
+    # the rebased binaries only depend on Fsp.fd, the FSP base addresses
+    # and the rebase tools, reuse them from a previous build if possible
+    try:
+        fsp_base_address = rebase_lib.GetFspBaseAddress(flash_map, 0x0)
+    except Exception as error:
+        print("ERROR:RebaseFspBinBaseAddress failed: {}".format(error))
+        sys.exit(1)
+
+    cache_entry = get_fsp_rebase_cache_entry(
+        config, os.path.join(file_dir, "Fsp.fd"), fsp_base_address,
+        [rebase_script, split_fsp_bin])
+    if restore_fsp_rebase_cache(cache_entry, file_dir):
+        if write_fsp_rebased_manifest(file_dir):
+            print("Using cached rebased FSP {}".format(cache_entry))
+            return
+        # drop the inconsistent entry and rebase again
+        print("Invalid cached rebased FSP {}".format(cache_entry))
+        shutil.rmtree(cache_entry, ignore_errors=True)
+        for name in FSP_REBASED_FILES:
+            os.remove(os.path.join(file_dir, name))
+
+    # rebase and split the FSP in this process, parsing Fsp.fd once and
+    # writing Fsp_Rebased.fd as Fsp_Rebased_S.fd + Fsp_Rebased_M.fd +
+    # Fsp_Rebased_T.fd
+    try:
+        rebase_lib.RebaseAndSplitFspBin(split_fsp_bin,
+                                        os.path.join(file_dir, "Fsp.fd"),
+                                        fsp_base_address,
+                                        file_dir,
+                                        concatOrder="SMT")
+    except Exception as error:
+        print("ERROR:RebaseFspBinBaseAddress failed: {}".format(error))
+        sys.exit(1)
+
+    if not os.path.isfile(os.path.join(file_dir, "Fsp_Rebased.fd")) or \
+       not write_fsp_rebased_manifest(file_dir):
+        print("!!! ERROR:failed to create fsp!!!")
+        sys.exit(1)
+
+    store_fsp_rebase_cache(config, cache_entry, file_dir)
+
+
+def get_file_hash(path):
+    """Gets the SHA-256 of a file
+
+        :param path: The file path
+        :type path: String
+        :returns: The hex digest of the file content
+        :rtype: String
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as hash_file:
+        for chunk in iter(lambda: hash_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_fsp_rebase_cache_entry(config, fsp_file, fsp_base_address,
+                               tool_files):
+    """Gets the cache directory of the rebased FSP binaries
+
+        The FSP base addresses are computed from FLASH_BASE, the
+        PcdFlashFvFsp{S,M,T}Offset of the flash map and the pad offset.
+        The content of the rebase tools is part of the key, so a change
+        of the tools does not reuse the binaries they rebased before.
+
+        :param config: The environment variables used in the build process
+        :type config: Dictionary
+        :param fsp_file: The Fsp.fd path
+        :type fsp_file: String
+        :param fsp_base_address: The FSP-S/M/T base addresses
+        :type fsp_base_address: Dictionary
+        :param tool_files: The scripts rebasing and splitting the FSP
+        :type tool_files: List
+        :returns: The cache entry directory
+        :rtype: String
+    """
+    cache_dir = os.path.join(config["WORKSPACE"], "Build", "FspRebaseCache")
+    if config.get("FSP_REBASE_CACHE"):
+        cache_dir = os.path.join(config["WORKSPACE"],
+                                 config["FSP_REBASE_CACHE"])
+
+    digest = hashlib.sha256()
+    digest.update(get_file_hash(fsp_file).encode("utf-8"))
+    for fsp_type in sorted(fsp_base_address):
+        digest.update("{}={:x};".format(
+            fsp_type, fsp_base_address[fsp_type]).encode("utf-8"))
+    digest.update(";".join(FSP_REBASED_FILES).encode("utf-8"))
+    for tool_file in tool_files:
+        digest.update(get_file_hash(tool_file).encode("utf-8"))
+    return os.path.join(cache_dir, digest.hexdigest())
+
+
+def restore_fsp_rebase_cache(cache_entry, file_dir):
+    """Restores the rebased FSP binaries from the cache
+
+        The binaries are hard linked if possible, copied otherwise.
+
+        :param cache_entry: The cache entry directory
+        :type cache_entry: String
+        :param file_dir: The FSP binary package directory
+        :type file_dir: String
+        :returns: True if the binaries were restored
+        :rtype: Boolean
+    """
+    try:
+        with open(os.path.join(cache_entry, "manifest.json"), "r") as manifest:
+            hashes = json.load(manifest)
+        # a hard linked binary modified in place also modifies the cache
+        for name in FSP_REBASED_FILES:
+            if get_file_hash(os.path.join(cache_entry, name)) != hashes[name]:
+                shutil.rmtree(cache_entry, ignore_errors=True)
+                return False
+    except (IOError, OSError, ValueError, KeyError):
+        return False
+
+    for name in FSP_REBASED_FILES:
+        try:
+            os.link(os.path.join(cache_entry, name),
+                    os.path.join(file_dir, name))
+        except (OSError, AttributeError):
+            shutil.copyfile(os.path.join(cache_entry, name),
+                            os.path.join(file_dir, name))
+
+    # most recently used
+    os.utime(cache_entry, None)
+    return True
+
+
+def store_fsp_rebase_cache(config, cache_entry, file_dir):
+    """Stores the rebased FSP binaries in the cache and evicts the least
+    recently used entries beyond FSP_REBASE_CACHE_SIZE
+
+        :param config: The environment variables used in the build process
+        :type config: Dictionary
+        :param cache_entry: The cache entry directory
+        :type cache_entry: String
+        :param file_dir: The FSP binary package directory
+        :type file_dir: String
+        :returns: nothing
+    """
+    try:
+        if os.path.isdir(cache_entry):
+            shutil.rmtree(cache_entry)
+        os.makedirs(cache_entry)
+        hashes = {}
+        for name in FSP_REBASED_FILES:
+            shutil.copyfile(os.path.join(file_dir, name),
+                            os.path.join(cache_entry, name))
+            hashes[name] = get_file_hash(os.path.join(cache_entry, name))
+        with open(os.path.join(cache_entry, "manifest.json"), "w") as manifest:
+            json.dump(hashes, manifest)
+    except (IOError, OSError) as error:
+        print("Error while caching the rebased FSP: {}".format(error))
+        shutil.rmtree(cache_entry, ignore_errors=True)
+        return
+
+    max_size = int(config.get("FSP_REBASE_CACHE_SIZE") or
+                   FSP_REBASE_CACHE_SIZE)
+    cache_dir = os.path.dirname(cache_entry)
+    entries = []
+    total_size = 0
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if not os.path.isdir(entry):
+            continue
+        size = sum(os.path.getsize(os.path.join(entry, item))
+                   for item in os.listdir(entry))
+        entries.append((os.path.getmtime(entry), size, entry))
+        total_size += size
+
+    # least recently used first
+    for _, size, entry in sorted(entries):
+        if total_size <= max_size:
+            break
+        if entry == cache_entry:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total_size -= size
+
+
+def rebase_fsp_script(config, rebase_script, flash_map, file_dir):
+    """Rebases the FSP binary with the RebaseFspBinBaseAddress.py command
+    and creates Fsp_Rebased.fd
+
+        :param config: The environment variables to be used
+            in the build process
+        :type config: Dictionary
+        :param rebase_script: The RebaseFspBinBaseAddress.py path
+        :type rebase_script: String
+        :param flash_map: The flash map FDF path
+        :type flash_map: String
+        :param file_dir: The FSP binary package directory
+        :type file_dir: String
+        :returns: nothing
+    """
+    command = [os.path.join(config['PYTHON_HOME'], "python"),
+               rebase_script,
+               flash_map,
+               os.path.join(config['WORKSPACE_FSP_BIN'],
+                            config['FSP_BIN_PKG']),
+               "Fsp.fd",
+               "0x0"]
+
+    _, _, _, return_code = execute_script(command, config, shell=False)
+
+    if return_code != 0:
+        print("ERROR:RebaseFspBinBaseAddress failed")
+        sys.exit(return_code)
+
+    # create Fsp_Rebased.fd which is Fsp_Rebased_S.fd +
+    # Fsp_Rebased_M + Fsp_Rebased_T
+    concatenate_files([os.path.join(file_dir, name)
+                       for name in FSP_REBASED_PARTS],
+                      os.path.join(file_dir, "Fsp_Rebased.fd"))
+
+
+def concatenate_files(parts, output):
+    """Concatenates files without reading them into memory
+
+        The data is copied by the kernel with copy_file_range or sendfile
+        where available, in large chunks otherwise.
+
+        :param parts: The paths of the files to concatenate
+        :type parts: List:String
+        :param output: The output file path
+        :type output: String
+        :returns: nothing
+    """
+    with open(output, "wb") as output_file:
+        for part in parts:
+            with open(part, "rb") as part_file:
+                size = os.fstat(part_file.fileno()).st_size
+                copy_file_data(part_file, output_file, size)
+
+
+def copy_file_data(source, destination, size):
+    """Copies size bytes from the current position of source to
+    destination
+
+        :param source: The file to copy from
+        :type source: File
+        :param destination: The file to copy to
+        :type destination: File
+        :param size: The number of bytes to copy
+        :type size: Integer
+        :returns: nothing
+    """
+    destination.flush()
+    offset = source.tell()
+    for kernel_copy in ("copy_file_range", "sendfile"):
+        if not hasattr(os, kernel_copy):
+            continue
+        copied = 0
+        try:
+            while copied < size:
+                if kernel_copy == "copy_file_range":
+                    count = os.copy_file_range(source.fileno(),
+                                               destination.fileno(),
+                                               size - copied,
+                                               offset + copied)
+                else:
+                    count = os.sendfile(destination.fileno(),
+                                        source.fileno(),
+                                        offset + copied,
+                                        size - copied)
+                if count == 0:
+                    break
+                copied += count
+        except OSError:
+            # not supported for these files, try the next way
+            if copied == 0:
+                continue
+            raise
+        if copied != size:
+            raise IOError("Short copy of {}".format(source.name))
+        source.seek(offset + copied)
+        destination.seek(0, os.SEEK_END)
+        return
+    shutil.copyfileobj(source, destination, COPY_BUFFER_SIZE)
+
+
+def write_fsp_rebased_manifest(file_dir):
+    """Checks Fsp_Rebased.fd against the SHA-256 of its parts and records
+    the offset, size and SHA-256 of each part in the Fsp_Rebased.json
+    manifest
+
+        :param file_dir: The FSP binary package directory
+        :type file_dir: String
+        :returns: True if Fsp_Rebased.fd is the concatenation of its parts
+        :rtype: Boolean
+    """
+    parts = []
+    offset = 0
+    for name in FSP_REBASED_PARTS:
+        size = os.path.getsize(os.path.join(file_dir, name))
+        parts.append({"name": name,
+                      "offset": offset,
+                      "size": size,
+                      "sha256": get_file_hash(os.path.join(file_dir, name))})
+        offset += size
+
+    if os.path.getsize(os.path.join(file_dir, "Fsp_Rebased.fd")) != offset:
+        return False
+
+    # hash each part range of Fsp_Rebased.fd, so a stale or corrupt
+    # concatenation of the same size is rejected too
+    with open(os.path.join(file_dir, "Fsp_Rebased.fd"), "rb") as fsp_rebased:
+        for part in parts:
+            digest = hashlib.sha256()
+            remaining = part["size"]
+            while remaining > 0:
+                chunk = fsp_rebased.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    return False
+                digest.update(chunk)
+                remaining -= len(chunk)
+            if digest.hexdigest() != part["sha256"]:
+                return False
+
+    with open(os.path.join(file_dir, "Fsp_Rebased.json"), "w") as manifest:
+        json.dump({"name": "Fsp_Rebased.fd", "size": offset,
+                   "parts": parts}, manifest, indent=2)
+    return True
+
+
 def post_build(config):
     """Post build process of BIOS image
 
@@ -433,6 +1219,11 @@ def post_build(config):
     final_fd = os.path.join(config["BUILD_DIR_PATH"], "FV",
                             "{}.fd".format(board_fd))
 
+    # Additional scripts before the fit table of this platform
+    result = pre_fit_ex(config)
+    if result is not None and isinstance(result, dict):
+        config.update(result)
+
     if config["BIOS_INFO_GUID"]:
         # Generate the fit table
         print("Generating FIT ...")
@@ -465,21 +1256,13 @@ def post_build(config):
         config.update(result)
 
     # cleanup
-    pattern = "Fsp_Rebased.*\\.fd$"
+    pattern = "Fsp_Rebased.*\\.(fd|json)$"
     file_dir = os.path.join(config['WORKSPACE_FSP_BIN'],
                             config['FSP_BIN_PKG'])
     for item in os.listdir(file_dir):
         if re.search(pattern, item):
             os.remove(os.path.join(file_dir, item))
 
-    if config.get("DYNAMIC_BUILD_INIT_FILES") is not None:
-        for item in config["DYNAMIC_BUILD_INIT_FILES"].split(","):
-            try:
-                os.remove(item)  # remove __init__.py
-                os.remove(item + "c")  # remove __init__.pyc as well
-            except OSError:
-                pass
-
     print("Done")
     if os.path.isfile(final_fd):
         print("Fd file can be found at {}".format(final_fd))
@@ -492,33 +1275,84 @@ def build_failed(config):
         :returns: nothing
     """
     print(" The EDKII BIOS Build has failed!")
-    # clean up
-    if config.get("DYNAMIC_BUILD_INIT_FILES") is not None:
-        for item in config["DYNAMIC_BUILD_INIT_FILES"].split(","):
-            if os.path.isfile(item):
-                try:
-                    os.remove(item)  # remove __init__.py
-                    os.remove(item + "c")  # remove __init__.pyc as well
-                except OSError:
-                    pass
     sys.exit(1)
 
 
-def import_platform_lib(path, function):
-    """Imports custom functions for the platforms being built
+def load_module(name, path):
+    """Loads a python module from its file path
 
-        :param path: the location of the custom build script to be executed
+        :param name: The module name
+        :type name: String
+        :param path: The module file path
         :type path: String
-        :param path: the function to be executed
+        :returns: The module
+        :rtype: Module
+    """
+    if not os.path.isfile(path):
+        raise ImportError("{} is not found".format(path))
+    if hasattr(importlib, "util"):
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        import imp
+        module = imp.load_source(name, path)
+    return module
+
+
+def get_platform_lib(path):
+    """Loads the custom build script of a platform, once per process
+
+        :param path: the location of the custom build script
         :type path: String
-        :returns: nothing
+        :returns: the custom build script module
+        :rtype: Module
+    """
+    path = os.path.abspath(path)
+    if path not in PLATFORM_LIBS:
+        name = "build_board_" + re.sub(r"\W", "_",
+                                       os.path.splitext(path)[0])
+        PLATFORM_LIBS[path] = load_module(name, path)
+    return PLATFORM_LIBS[path]
+
+
+def run_platform_hook(config, hook):
+    """Runs a function of the custom build script of the platform,
+    if the script defines it
+
+        :param config: The environment variables used in the build process
+        :type config: Dictionary
+        :param hook: The name of the function
+        :type hook: String
+        :returns: config dictionary
+        :rtype: Dictionary
     """
-    if path.endswith(".py"):
-        path = path[:-3]
-    path = path.replace(os.sep, ".")
-    module = import_module(path)
-    lib = getattr(module, function)
-    return lib
+    if not config.get("ADDITIONAL_SCRIPTS"):
+        return None
+
+    # ADDITIONAL_SCRIPTS is relative to WORKSPACE_PLATFORM
+    path = config["ADDITIONAL_SCRIPTS"]
+    if config.get("WORKSPACE_PLATFORM") and \
+       os.path.isfile(os.path.join(config["WORKSPACE_PLATFORM"], path)):
+        path = os.path.join(config["WORKSPACE_PLATFORM"], path)
+
+    try:
+        platform_lib = get_platform_lib(path)
+    except ImportError as error:
+        print(config["ADDITIONAL_SCRIPTS"], str(error))
+        build_failed(config)
+
+    platform_function = getattr(platform_lib, hook, None)
+    if platform_function is None:
+        return None
+
+    start_time = time.time()
+    functions = {"execute_script": execute_script}
+    with profile_phase(hook, "hook"):
+        result = platform_function(config, functions)
+    print("{} of {} took {:.1f} s".format(hook, config["ADDITIONAL_SCRIPTS"],
+                                          time.time() - start_time))
+    return result
 
 
 def pre_build_ex(config):
@@ -530,17 +1364,7 @@ def pre_build_ex(config):
         :returns: config dictionary
         :rtype: Dictionary
     """
-    if config.get("ADDITIONAL_SCRIPTS"):
-        try:
-            platform_function =\
-                import_platform_lib(config["ADDITIONAL_SCRIPTS"],
-                                    "pre_build_ex")
-            functions = {"execute_script": execute_script}
-            return platform_function(config, functions)
-        except ImportError as error:
-            print(config["ADDITIONAL_SCRIPTS"], str(error))
-            build_failed(config)
-    return None
+    return run_platform_hook(config, "pre_build_ex")
 
 
 def build_ex(config):
@@ -552,17 +1376,34 @@ def build_ex(config):
         :returns: config dictionary
         :rtype: Dictionary
     """
-    if config.get("ADDITIONAL_SCRIPTS"):
-        try:
-            platform_function =\
-                import_platform_lib(config["ADDITIONAL_SCRIPTS"],
-                                    "build_ex")
-            functions = {"execute_script": execute_script}
-            return platform_function(config, functions)
-        except ImportError as error:
-            print("error", config["ADDITIONAL_SCRIPTS"], str(error))
-            build_failed(config)
-    return None
+    return run_platform_hook(config, "build_ex")
+
+
+def post_rebase_ex(config):
+    """ An extension of the FSP rebase as defined platform
+        specific build setup script, called once the rebased FSP
+        binaries are created
+
+        :param config: The environment variables used in the build process
+        :type config: Dictionary
+        :returns: config dictionary
+        :rtype: Dictionary
+    """
+    return run_platform_hook(config, "post_rebase_ex")
+
+
+def pre_fit_ex(config):
+    """ An extension of the post build process as defined platform
+        specific build setup script, called before the FIT table
+        is generated
+
+        :param config: The environment variables used in the post build
+            process
+        :type config: Dictionary
+        :returns: config dictionary
+        :rtype: Dictionary
+    """
+    return run_platform_hook(config, "pre_fit_ex")
 
 
 def post_build_ex(config):
@@ -575,17 +1416,7 @@ def post_build_ex(config):
         :returns: config dictionary
         :rtype: Dictionary
     """
-    if config.get("ADDITIONAL_SCRIPTS"):
-        try:
-            platform_function =\
-                import_platform_lib(config["ADDITIONAL_SCRIPTS"],
-                                    "post_build_ex")
-            functions = {"execute_script": execute_script}
-            return platform_function(config, functions)
-        except ImportError as error:
-            print(config["ADDITIONAL_SCRIPTS"], str(error))
-            build_failed(config)
-    return None
+    return run_platform_hook(config, "post_build_ex")
 
 
 def clean_ex(config):
@@ -596,17 +1427,7 @@ def clean_ex(config):
         :returns: config dictionary
         :rtype: Dictionary
     """
-    if config.get("ADDITIONAL_SCRIPTS"):
-        try:
-            platform_function =\
-                import_platform_lib(config["ADDITIONAL_SCRIPTS"],
-                                    "clean_ex")
-            functions = {"execute_script": execute_script}
-            return platform_function(config, functions)
-        except ImportError as error:
-            print(config["ADDITIONAL_SCRIPTS"], str(error))
-            build_failed(config)
-    return None
+    return run_platform_hook(config, "clean_ex")
 
 
 def get_environment_variables(std_out_str, marker):
@@ -624,8 +1445,10 @@ def get_environment_variables(std_out_str, marker):
     environment_vars = {}
     out_put = ""
     for line in std_out_str.split("\n"):
-        if start_env_update and len(line.split("=")) == 2:
-            key, value = line.split("=")
+        # values may contain "=", windows also prints hidden
+        # variables such as "=C:=C:\\" which have no name
+        if start_env_update and "=" in line and not line.startswith("="):
+            key, value = line.split("=", 1)
             environment_vars[key] = value
         else:
             out_put += "\n" + line.replace(marker, "")
@@ -638,8 +1461,133 @@ def get_environment_variables(std_out_str, marker):
     return (out_put, environment_vars)
 
 
+def stream_pipe(pipe, console, tail, log=None, lock=None,
+                env_marker=None, env_lines=None, progress=None):
+    """Reads a process pipe line by line, runs on a background thread
+
+        :param pipe: The process pipe to read
+        :type pipe: File
+        :param console: The console stream the lines are echoed to
+        :type console: File
+        :param tail: Keeps the last lines read
+        :type tail: collections.deque
+        :param log: The log the lines are written to
+        :type log: logging.Logger
+        :param lock: Serializes the console output of several pipes
+        :type lock: threading.Lock
+        :param env_marker: A begining and end mark of environment
+            variables printed to the pipe
+        :type env_marker: String
+        :param env_lines: Collects the environment variable lines
+        :type env_lines: List:String
+        :param progress: Called with every line, e.g. to parse
+            progress markers
+        :type progress: Function
+        :returns: nothing
+    """
+    if lock is None:
+        lock = threading.Lock()
+    in_env = False
+    failed = False
+    for line in iter(pipe.readline, ""):
+        line = line.rstrip("\n")
+        if env_marker is not None and env_marker in line:
+            in_env = not in_env
+            env_lines.append(line)
+            continue
+        if in_env:
+            env_lines.append(line)
+            continue
+
+        tail.append(line)
+        # keep reading to the end of the pipe whatever happens, the
+        # process blocks on a full pipe otherwise
+        try:
+            with lock:
+                console.write(line + "\n")
+                console.flush()
+            if log is not None:
+                log.info(line)
+            if progress is not None:
+                progress(line)
+        except Exception:
+            if not failed:
+                failed = True
+                try:
+                    traceback.print_exc()
+                except Exception:
+                    pass
+    pipe.close()
+
+
+def get_command_log(config, name):
+    """Gets the rotating log file the streamed output of a command is
+    written to, in COMMAND_LOG_DIR or the workspace Build directory
+
+        :param config: The environment variables used in the build process
+        :type config: Dictionary
+        :param name: The command name
+        :type name: String
+        :returns: The log file path
+        :rtype: String
+    """
+    log_dir = config.get("COMMAND_LOG_DIR") or \
+        os.path.join(config["WORKSPACE"], "Build")
+    return os.path.join(log_dir, "{}.log".format(name))
+
+
+class BuildProgress(object):
+    """Parses the progress of the EDK2 build command from its output,
+    counts the modules built and records the start of the build steps
+    in the profile
+    """
+
+    def __init__(self):
+        self.modules = 0
+
+    def __call__(self, line):
+        """Parses an output line of the build command
+
+            :param line: The output line
+            :type line: String
+            :returns: nothing
+        """
+        if line.startswith("Building ... "):
+            self.modules += 1
+            return
+        if PROFILER is None:
+            return
+        for marker in EDK2_BUILD_MARKERS:
+            if line.startswith(marker):
+                PROFILER.mark(marker, {"modules": self.modules})
+                return
+
+
+def get_stream_log(log_file):
+    """Gets a logger writing to a rotating log file
+
+        :param log_file: The log file path
+        :type log_file: String
+        :returns: The logger
+        :rtype: logging.Logger
+    """
+    log = logging.getLogger("build_bios.stream." + log_file)
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    if not log.handlers:
+        if not os.path.isdir(os.path.dirname(os.path.abspath(log_file))):
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)))
+        handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=STREAM_LOG_MAX_BYTES,
+            backupCount=STREAM_LOG_BACKUP_COUNT)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(handler)
+    return log
+
+
 def execute_script(command, env_variables, collect_env=False,
-                   enable_std_pipe=False, shell=True):
+                   enable_std_pipe=False, shell=True,
+                   stream_output=False, log_file=None, progress=None):
     """launches a process that executes a script/shell command passed to it
 
         :param command: The command/script with its commandline
@@ -652,6 +1600,15 @@ def execute_script(command, env_variables, collect_env=False,
         :type collect_env: Boolean
         :param enable_std_pipe: Enables process out to be piped to
         :type enable_std_pipe: String
+        :param stream_output: Reads the process output line by line,
+            echoes it to the console and keeps only its last lines
+        :type stream_output: Boolean
+        :param log_file: A rotating log file the streamed output is
+            written to
+        :type log_file: String
+        :param progress: Called with every streamed std_out line, e.g.
+            to parse progress markers
+        :type progress: Function
         :returns: a tuple of std_out, stderr , environment variables,
             return code
         :rtype: Tuple: (std_out, stderr , enVar, return_code)
@@ -666,10 +1623,15 @@ def execute_script(command, env_variables, collect_env=False,
              "shell": shell,
              "cwd": env_variables["WORKSPACE"]}
 
-    if enable_std_pipe or collect_env:
+    if enable_std_pipe or collect_env or stream_output:
         kwarg["stdout"] = subprocess.PIPE
         kwarg["stderr"] = subprocess.PIPE
 
+    # the commands of a parallel build job must not inherit its ignored
+    # SIGINT, so they stop with it on a keyboard interruption
+    if BUILD_JOB_PROCESS and os.name == "posix":
+        kwarg["preexec_fn"] = restore_keyboard_interruption
+
     # collect environment variables
     if collect_env:
         # get the binary that prints environment variables based on os
@@ -686,21 +1648,86 @@ def execute_script(command, env_variables, collect_env=False,
                                        "&&", get_var_command,
                                        "&&", "echo", env_marker])
 
-    # execute the command
-    execute = subprocess.Popen(command, **kwarg)
-    std_out, stderr = execute.communicate()
-    code = execute.returncode
+    if isinstance(command, list):
+        command_name = os.path.basename(command[0])
+        command_line = " ".join(command)
+    else:
+        command_name = command.split(" ")[0]
+        command_line = command
+
+    with profile_phase(command_name, "command",
+                       {"command": command_line}) as event:
+        # execute the command
+        execute = subprocess.Popen(command, **kwarg)
+        if stream_output:
+            std_out, stderr, env_out = stream_process(execute, env_marker,
+                                                      log_file, progress)
+        else:
+            std_out, stderr = execute.communicate()
+        code = execute.returncode
+
+        # wait for process to be done
+        execute.wait()
 
-    # wait for process to be done
-    execute.wait()
+        if event is not None:
+            event["args"]["exit_code"] = code
 
     # if collect enviroment variables
-    if collect_env:
+    if collect_env and stream_output:
+        # the environment variables were kept apart from the output
+        _, env = get_environment_variables(env_out, env_marker)
+    elif collect_env:
         # get the new environment variables
         std_out, env = get_environment_variables(std_out, env_marker)
     return (std_out, stderr, env, code)
 
 
+def stream_process(execute, env_marker, log_file=None, progress=None):
+    """Streams the std_out and stderr of a process until it exits
+
+        :param execute: The process with piped std_out and stderr
+        :type execute: subprocess.Popen
+        :param env_marker: A begining and end mark of environment
+            variables printed to std_out
+        :type env_marker: String
+        :param log_file: A rotating log file the output is written to
+        :type log_file: String
+        :param progress: Called with every std_out line
+        :type progress: Function
+        :returns: the last std_out lines, the last stderr lines and
+            the environment variable lines
+        :rtype: Tuple: (String, String, String)
+    """
+    log = None
+    if log_file:
+        log = get_stream_log(log_file)
+
+    lock = threading.Lock()
+    std_out_tail = collections.deque(maxlen=STREAM_TAIL_LINES)
+    stderr_tail = collections.deque(maxlen=STREAM_TAIL_LINES)
+    env_lines = []
+    readers = [threading.Thread(target=stream_pipe,
+                                args=(execute.stdout, sys.stdout,
+                                      std_out_tail, log, lock,
+                                      env_marker, env_lines, progress)),
+               threading.Thread(target=stream_pipe,
+                                args=(execute.stderr, sys.stderr,
+                                      stderr_tail, log, lock))]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+    for reader in readers:
+        reader.join()
+    execute.wait()
+
+    if log is not None:
+        for handler in log.handlers:
+            handler.flush()
+
+    return ("\n".join(std_out_tail), "\n".join(stderr_tail),
+            "\n".join(env_lines))
+
+
 def patch_config(config):
     """ An extension of the platform cleanning
 
@@ -715,32 +1742,6 @@ def patch_config(config):
     return new_config
 
 
-def py_27_fix(config):
-    """  Prepares build for python 2.7 => build
-        :param config: The environment variables used in the build process
-        :type config: Dictionary
-        :returns: config dictionary
-        :rtype: Dictionary
-    """
-    if not sys.version_info > (3, 0):
-        path_list = []
-        # create __init__.py in directories in this path
-        if config.get("ADDITIONAL_SCRIPTS"):
-            # get the directory
-            path_to_directory =\
-                os.path.dirname(config.get("ADDITIONAL_SCRIPTS"))
-            path = ""
-            for directories in path_to_directory.split(os.sep):
-                path += directories + os.sep
-                init_file = path + os.sep + "__init__.py"
-                if not os.path.isfile(init_file):
-                    open(init_file, 'w').close()
-                    path_list.append(init_file)
-            config["DYNAMIC_BUILD_INIT_FILES"] = ",".join(path_list)
-
-    return config
-
-
 def clean(build_config, board=False):
     """Cleans the build workspace
 
@@ -847,19 +1848,54 @@ def update_target_file(config):
         modified.append(string)
 
         string = "{} = {}\n".format("BUILD_RULE_CONF",
-                                    os.path.join("Conf", "build_rule.txt"))
+                                    os.path.relpath(
+                                        os.path.join(config["CONF_PATH"],
+                                                     "build_rule.txt"),
+                                        config["WORKSPACE"]))
         modified.append(string)
 
+    # keep target.txt and its modification time if nothing changed
+    if modified == contents:
+        return True
+
     if modified is not None:
-        with open(os.path.join(config["WORKSPACE"],
-                               "Conf", "target.txt"), 'w') as target:
-            for line in modified:
-                target.write(line)
-            result = True
+        write_file_atomic(os.path.join(config["CONF_PATH"], "target.txt"),
+                          "".join(modified))
+        result = True
 
     return result
 
 
+def write_file_atomic(path, contents):
+    """Writes a file through a temporary file renamed over it, so
+    readers never see a partially written file
+
+        :param path: The file path
+        :type path: String
+        :param contents: The file contents
+        :type contents: String
+        :returns: nothing
+    """
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                         prefix=os.path.basename(path))
+    try:
+        with os.fdopen(handle, 'w') as temp_file:
+            temp_file.write(contents)
+        if os.path.isfile(path):
+            shutil.copymode(path, temp_path)
+        if hasattr(os, "replace"):
+            os.replace(temp_path, path)
+        else:
+            # python 2.7 can not rename over an existing file on windows
+            if os.name == 'nt' and os.path.isfile(path):
+                os.remove(path)
+            os.rename(temp_path, path)
+    except (IOError, OSError):
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        raise
+
+
 def get_config():
     """Reads the default projects config file
 
@@ -921,6 +1957,9 @@ def get_cmd_config_arguments(arguments):
     if arguments.fspapi is True:
         result["API_MODE_FSP_WRAPPER_BUILD"] = "TRUE"
 
+    if arguments.force_tools is True:
+        result["FORCE_TOOLS_BUILD"] = "TRUE"
+
     if not arguments.UseHashCache:
         result['BINARY_CACHE_CMD_LINE'] = ''
     elif arguments.BinCacheDest:
@@ -961,7 +2000,18 @@ def get_cmd_arguments(build_config):
                         help='the platform to build',
                         choices=build_config.get("PLATFORMS"),
                         required=('-l' not in sys.argv and
-                                  '--cleanall' not in sys.argv))
+                                  '--cleanall' not in sys.argv and
+                                  '--all' not in sys.argv and
+                                  not any(arg.startswith('--platforms')
+                                          for arg in sys.argv)))
+
+    parser.add_argument('--platforms', dest="platforms",
+                        help='comma separated list of platforms to \
+                            build in parallel')
+
+    parser.add_argument('--all', dest="all_platforms",
+                        help='builds all platforms in parallel',
+                        action='store_true')
 
     parser.add_argument('--toolchain', '-t', dest="toolchain",
                         help="using the Tool Chain Tagname to build \
@@ -1008,6 +2058,15 @@ def get_cmd_arguments(build_config):
     parser.add_argument("--fspapi", help="API mode fsp wrapper build enabled",
                         action='store_true', dest="fspapi")
 
+    parser.add_argument("--force-tools", help="rebuild BaseTools and \
+                            silicon tools even if they are up to date",
+                        action='store_true', dest="force_tools")
+
+    parser.add_argument("--profile", nargs='?', const="", dest="profile",
+                        help="write the time and resources used by each \
+                            build phase to a Chrome trace file, \
+                            Build/<board>/BuildProfile.json by default")
+
     parser.add_argument("--hash", action="store_true", dest="UseHashCache", default=False,
                         help="Enable hash-based caching during build process.")
 
@@ -1022,6 +2081,310 @@ def get_cmd_arguments(build_config):
     return parser.parse_args()
 
 
+def build_platform(platform_name, build_config, arguments, job_config=None):
+    """Runs the pre build, build and post build of one platform
+
+        :param platform_name: The name of the platform to be built
+        :type platform_name: String
+        :param build_config: The config defined in the Build.cfg file
+        :type build_config: Dictionary
+        :param arguments: The commandline arguments input by the user
+        :type arguments: argparse object
+        :param job_config: Config overrides of a parallel build job
+        :type job_config: Dictionary
+        :returns: nothing
+    """
+    # get platform specific config
+    platform_config = get_platform_config(platform_name, build_config)
+
+    # update general build config with platform specific config
+    config = dict(build_config.get("DEFAULT_CONFIG"))
+    config.update(platform_config.get("CONFIG"))
+
+    # if user selected clean
+    if arguments.clean:
+        clean(config, board=True)
+
+    # Override config with cmd arguments
+    cmd_config_args = get_cmd_config_arguments(arguments)
+    config.update(cmd_config_args)
+
+    if job_config is not None:
+        config.update(job_config)
+
+    global PROFILER
+    if arguments.profile is not None:
+        PROFILER = BuildProfiler()
+        profile_file = arguments.profile
+        if not profile_file or job_config is not None:
+            profile_file = os.path.join(
+                os.path.abspath(os.path.join("..", "..", "..", "")),
+                "Build", config["PLATFORM_BOARD_PACKAGE"], config["BOARD"],
+                "BuildProfile.json")
+
+    try:
+        # get pre_build configurations
+        with profile_phase("pre_build"):
+            config = pre_build(config,
+                               build_type=arguments.target,
+                               toolchain=arguments.toolchain,
+                               silent=arguments.silent)
+
+        # build selected platform
+        with profile_phase("build"):
+            config = build(config)
+
+        # post build
+        with profile_phase("post_build"):
+            post_build(config)
+    finally:
+        if PROFILER is not None:
+            PROFILER.write(os.path.abspath(profile_file))
+            PROFILER = None
+
+
+def get_parallel_platforms(arguments, build_config):
+    """Gets the platforms selected for a parallel build
+
+        :param arguments: The commandline arguments input by the user
+        :type arguments: argparse object
+        :param build_config: The config defined in the Build.cfg file
+        :type build_config: Dictionary
+        :returns: The platform names or None for a single platform build
+        :rtype: List:String
+    """
+    if arguments.all_platforms:
+        platforms = list(build_config.get("PLATFORMS"))
+    elif arguments.platforms:
+        platforms = [name.strip() for name in arguments.platforms.split(",")
+                     if name.strip()]
+    else:
+        return None
+
+    for name in platforms:
+        if name not in build_config.get("PLATFORMS"):
+            print("Unknown platform {}".format(name))
+            sys.exit(1)
+
+    if arguments.clean:
+        print("--clean is not supported in a parallel build")
+        sys.exit(1)
+
+    return platforms
+
+
+def get_build_lanes(platforms, build_config, arguments):
+    """Groups the platforms into lanes that are built concurrently
+
+        Boards using the same FSP binary package write the same
+        Fsp_Rebased*.fd files, these are built one after the other
+        in a single lane.
+
+        :param platforms: The names of the platforms to be built
+        :type platforms: List:String
+        :param build_config: The config defined in the Build.cfg file
+        :type build_config: Dictionary
+        :param arguments: The commandline arguments input by the user
+        :type arguments: argparse object
+        :returns: The platform names of each lane
+        :rtype: List:List:String
+    """
+    lanes = []
+    fsp_lanes = {}
+    cmd_config_args = get_cmd_config_arguments(arguments)
+    for name in platforms:
+        config = dict(build_config.get("DEFAULT_CONFIG"))
+        config.update(get_platform_config(name, build_config).get("CONFIG"))
+        config.update(cmd_config_args)
+
+        fsp_bin_pkg = None
+        if config.get("FSP_WRAPPER_BUILD") == "TRUE":
+            fsp_bin_pkg = config.get("FSP_BIN_PKG")
+            if config.get("API_MODE_FSP_WRAPPER_BUILD", "FALSE") == "TRUE" \
+               and config.get("FSP_BIN_PKG_FOR_API_MODE") is not None:
+                fsp_bin_pkg = config["FSP_BIN_PKG_FOR_API_MODE"]
+
+        if fsp_bin_pkg in fsp_lanes:
+            fsp_lanes[fsp_bin_pkg].append(name)
+            continue
+
+        lane = [name]
+        lanes.append(lane)
+        if fsp_bin_pkg:
+            fsp_lanes[fsp_bin_pkg] = lane
+    return lanes
+
+
+def get_job_config(platform_name, build_config, processors):
+    """Gets the config overrides isolating a parallel build job
+
+        Each job gets its own Conf directory, build log and build report
+        under the Build directory of its board.
+
+        :param platform_name: The name of the platform to be built
+        :type platform_name: String
+        :param build_config: The config defined in the Build.cfg file
+        :type build_config: Dictionary
+        :param processors: The number of processors given to the job
+        :type processors: Integer
+        :returns: The job config dictionary
+        :rtype: Dictionary
+    """
+    config = dict(build_config.get("DEFAULT_CONFIG"))
+    config.update(get_platform_config(platform_name,
+                                      build_config).get("CONFIG"))
+
+    workspace = os.path.abspath(os.path.join("..", "..", "..", ""))
+    job_dir = os.path.join(workspace, "Build",
+                           config["PLATFORM_BOARD_PACKAGE"],
+                           config["BOARD"])
+    return {"CONF_PATH": os.path.join(job_dir, "Conf"),
+            "BUILD_LOG": os.path.join(job_dir, "Build.log"),
+            "BUILD_REPORT": os.path.join(job_dir, "BuildReport.log"),
+            "BUILD_BIOS_LOG": os.path.join(job_dir, "build_bios.log"),
+            "COMMAND_LOG_DIR": job_dir,
+            "NUMBER_OF_PROCESSORS": str(processors)}
+
+
+def init_build_job(tools_build_lock):
+    """Initializes a parallel build job process
+
+        :param tools_build_lock: Lock serializing the tools build
+        :type tools_build_lock: multiprocessing.Lock
+        :returns: nothing
+    """
+    global TOOLS_BUILD_LOCK
+    global BUILD_JOB_PROCESS
+    TOOLS_BUILD_LOCK = tools_build_lock
+    BUILD_JOB_PROCESS = True
+    # the main process handles the keyboard interruption
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def restore_keyboard_interruption():
+    """Restores the default SIGINT action in a process started by a
+    parallel build job, runs in the child before the command
+
+        :returns: nothing
+    """
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+
+def build_lane(lane):
+    """Builds the platforms of a lane, runs in a parallel build job process
+
+        :param lane: (platform name, build config, arguments, job config)
+            of each platform in the lane
+        :type lane: List:Tuple
+        :returns: (platform name, exit code, build time, log file)
+            of each platform in the lane
+        :rtype: List:Tuple
+    """
+    results = []
+    for platform_name, build_config, arguments, job_config in lane:
+        start_time = time.time()
+        exit_code = 0
+        log_file = job_config["BUILD_BIOS_LOG"]
+        if not os.path.isdir(os.path.dirname(log_file)):
+            os.makedirs(os.path.dirname(log_file))
+
+        # redirect this process and its children output to the log file
+        with open(log_file, 'w') as log:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(log.fileno(), sys.stdout.fileno())
+            os.dup2(log.fileno(), sys.stderr.fileno())
+            try:
+                build_platform(platform_name, build_config,
+                               arguments, job_config)
+            except SystemExit as error:
+                if error.code is None or isinstance(error.code, int):
+                    exit_code = error.code or 0
+                else:
+                    exit_code = 1
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+        results.append((platform_name, exit_code,
+                        time.time() - start_time, log_file))
+    return results
+
+
+def build_parallel(platforms, build_config, arguments):
+    """Builds several platforms concurrently with a process pool
+
+        :param platforms: The names of the platforms to be built
+        :type platforms: List:String
+        :param build_config: The config defined in the Build.cfg file
+        :type build_config: Dictionary
+        :param arguments: The commandline arguments input by the user
+        :type arguments: argparse object
+        :returns: 0 if all platforms were built, 1 otherwise
+        :rtype: Integer
+    """
+    start_time = time.time()
+    lanes = get_build_lanes(platforms, build_config, arguments)
+
+    # split the processors between the jobs
+    processors = int(build_config.get("DEFAULT_CONFIG").get(
+        "NUMBER_OF_PROCESSORS", "0") or "0")
+    if processors <= 0:
+        processors = multiprocessing.cpu_count()
+    job_count = min(len(lanes), processors)
+    job_processors = max(1, processors // job_count)
+
+    jobs = []
+    for lane in lanes:
+        jobs.append([(name, build_config, arguments,
+                      get_job_config(name, build_config, job_processors))
+                     for name in lane])
+
+    print("Building {} in {} parallel jobs with {} processors each".format(
+        ", ".join(platforms), job_count, job_processors))
+
+    pool = multiprocessing.Pool(job_count, init_build_job,
+                                (multiprocessing.Lock(),))
+    try:
+        lane_results = pool.map(build_lane, jobs)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    results = [result for lane in lane_results for result in lane]
+    print_build_summary(results, time.time() - start_time)
+
+    if any(exit_code != 0 for _, exit_code, _, _ in results):
+        return 1
+    return 0
+
+
+def print_build_summary(results, elapsed_time):
+    """Displays the result and build time of each platform
+
+        :param results: (platform name, exit code, build time, log file)
+            of each platform
+        :type results: List:Tuple
+        :param elapsed_time: The wall-clock time of the whole build
+        :type elapsed_time: Float
+        :returns: nothing
+    """
+    print("==============================================")
+    print(" {:<20} {:<6} {:>10}  {}".format("Platform", "Result",
+                                           "Time (s)", "Log"))
+    # longest build first
+    for name, exit_code, build_time, log_file in \
+            sorted(results, key=lambda result: result[2], reverse=True):
+        print(" {:<20} {:<6} {:>10.1f}  {}".format(
+            name, "PASS" if exit_code == 0 else "FAIL",
+            build_time, log_file))
+    print(" Total build time: {:.1f} s".format(elapsed_time))
+    print("==============================================")
+
+
 def keyboard_interruption(int_signal, int_frame):
     """ Catches a keyboard interruption handler
 
@@ -1052,32 +2415,12 @@ def main():
     if arguments.clean_all:
         clean(build_config.get("DEFAULT_CONFIG"))
 
-    # get platform specific config
-    platform_config = get_platform_config(arguments.platform, build_config)
-
-    # update general build config with platform specific config
-    config = build_config.get("DEFAULT_CONFIG")
-    config.update(platform_config.get("CONFIG"))
-
-    # if user selected clean
-    if arguments.clean:
-        clean(config, board=True)
-
-    # Override config with cmd arguments
-    cmd_config_args = get_cmd_config_arguments(arguments)
-    config.update(cmd_config_args)
-
-    # get pre_build configurations
-    config = pre_build(config,
-                       build_type=arguments.target,
-                       toolchain=arguments.toolchain,
-                       silent=arguments.silent)
-
-    # build selected platform
-    config = build(config)
+    # build several platforms at once
+    platforms = get_parallel_platforms(arguments, build_config)
+    if platforms is not None:
+        sys.exit(build_parallel(platforms, build_config, arguments))
 
-    # post build
-    post_build(config)
+    build_platform(arguments.platform, build_config, arguments)
 
 
 if __name__ == "__main__":